@@ -0,0 +1,87 @@
+"""
+Parser backend conformance check
+
+Parses an export with every installed parser backend of the soup engine,
+timing each run, and checks that every backend finds the same message
+groups as html.parser, the reference, with the same partition keys and the
+same normalized markup (see dsparser.backends.conformance_differences; this
+is the check "auto" runs on a small sample to choose its backend). The
+synthetic export includes markup the parsers are known to build
+differently, see EDGE_CASES in synthetic.py. Exits with status 1 if any
+backend differs.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+from dsparser.parser import parse_discord_html
+from dsparser.backends import available_backends, auto_backend, conformance_differences, REFERENCE_BACKEND
+from dsparser.utils.compression import open_input
+from dsparser.utils.timestamps import timestamp_classifier
+
+from synthetic import generate_export
+
+def read_export(path):
+    """Returns the decoded HTML of an export, decompressing it if needed"""
+    with open_input(path) as f:
+        return f.read().decode('utf-8', errors='replace')
+
+def main():
+    parser = argparse.ArgumentParser(description='Parser backend conformance check')
+    parser.add_argument('--input', '-i', help='Discord HTML export to parse; a synthetic export is generated if omitted')
+    parser.add_argument('--groups', '-g', type=int, default=5000, help='Message groups in the synthetic export')
+    parser.add_argument('--partition-by', '-p', default='year', help='Partitioning scheme of the runs (default: year)')
+    parser.add_argument('--workers', '-w', type=int, default=4, help='Worker threads of each run')
+
+    args = parser.parse_args()
+
+    backends = available_backends()
+    print(f"Installed backends: {', '.join(backends)}; auto uses {auto_backend()}")
+
+    work_dir = tempfile.mkdtemp(prefix="dsparser-conformance-")
+    try:
+        input_file = args.input
+        if input_file is None:
+            input_file = os.path.join(work_dir, 'synthetic_export.html')
+            generate_export(input_file, args.groups, edge_cases=True)
+
+        output_dirs = {}
+        for backend in backends:
+            output_dirs[backend] = os.path.join(work_dir, backend)
+            with open(os.devnull, 'w') as devnull:
+                stdout, stderr = sys.stdout, sys.stderr
+                sys.stdout = sys.stderr = devnull
+                try:
+                    start_time = time.perf_counter()
+                    parse_discord_html(input_file, output_dirs[backend], args.workers, ordered=True,
+                                       partition=args.partition_by, backend=backend)
+                    elapsed = time.perf_counter() - start_time
+                finally:
+                    sys.stdout, sys.stderr = stdout, stderr
+            print(f"{backend:<12} {elapsed:8.2f}s")
+
+        content = read_export(input_file)
+        timestamp_classifier.detect(content[:1024 * 1024])
+        reference = REFERENCE_BACKEND
+        failures = 0
+        for backend in backends:
+            if backend == reference:
+                continue
+            differences = conformance_differences(backend, content, reference)
+            if differences:
+                failures += 1
+                print(f"FAIL {backend}: {len(differences)} message groups differ from {reference}, "
+                      f"first at position {differences[0]}")
+            else:
+                print(f"OK   {backend}: same message groups, partition keys and normalized markup as {reference}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
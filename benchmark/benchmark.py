@@ -1,20 +1,47 @@
 """
 DSParser Benchmark Tool
 
-This script benchmarks the DSParser tool under various configurations
-to provide objective performance metrics.
+Benchmarks DSParser in process on a real or synthetic export:
+
+- Stage timings: read, boundary split, parse, classify, queue and write,
+  each timed on its own for every engine
+- End-to-end runs of parse_discord_html for every configuration, each in a
+  fresh child process that reports its own peak RSS
+
+Results are saved as JSON and can be compared against a stored baseline;
+the tool exits with status 1 when a metric regresses by more than the
+threshold, so it can gate changes in CI.
 """
 
 import os
 import sys
+import json
 import time
+import queue
+import shutil
 import argparse
-import subprocess
-import matplotlib.pyplot as plt
-import numpy as np
-from tqdm import tqdm
+import platform
+import tempfile
+import statistics
 import multiprocessing
-import psutil
+
+from dsparser import parser
+from dsparser.parser import parse_discord_html, split_byte_ranges
+from dsparser.backends import BACKENDS, resolve_backend
+from dsparser.metrics import run_metrics
+from dsparser.partition import parse_message_info, by_year
+from dsparser.utils.scanner import iter_group_spans
+from dsparser.utils.reader import read_message_range
+
+from synthetic import generate_export
+
+# Version 2 keeps the median of repeated end-to-end runs instead of the best
+RESULTS_VERSION = 2
+STAGES = ["read", "split", "parse", "classify", "queue", "write"]
+# Stages faster than this are too noisy to compare with a baseline
+MIN_COMPARED_SECONDS = 0.05
+# End-to-end runs include process startup and pool creation, so they need more time to compare
+MIN_COMPARED_RUN_SECONDS = 1.0
 
 def format_size(size_bytes):
     """Format bytes to human readable format"""
@@ -24,249 +51,336 @@ def format_size(size_bytes):
         size_bytes /= 1024.0
     return f"{size_bytes:.2f} TB"
 
-def get_file_info(file_path):
-    """Get file size and line count"""
-    size = os.path.getsize(file_path)
-    with open(file_path, 'rb') as f:
-        line_count = sum(1 for _ in f)
-    return size, line_count
-
-def run_benchmark(input_file, output_dir, chunk_sizes, worker_counts):
-    """Run benchmark with various configurations"""
-    results = []
-    file_size, line_count = get_file_info(input_file)
-    
+def peak_rss():
+    """
+    Returns the peak resident set size of this process and of its finished
+    children in bytes, as reported by the operating system.
+    """
+    try:
+        import resource
+    except ImportError:
+        # Windows has no resource module; psutil reports the peak working set there
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset, None
+        except (ImportError, AttributeError):
+            return None, None
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+def count_input(input_file):
+    """Counts the message groups and messages of an export"""
+    with open(input_file, 'rb') as f:
+        data = f.read()
+    groups = data.count(b'<div class="chatlog__message-group"')
+    messages = data.count(b'class="chatlog__message "') + data.count(b'class="chatlog__message"')
+    return groups, messages
+
+def time_stages(input_file, engine, chunk_size_mb, output_dir, backend):
+    """
+    Runs the pipeline stages one after another in this process and times each.
+
+    Returns:
+        Dictionary of stage name to seconds
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    chunk_size = chunk_size_mb * 1024 * 1024
+    file_size = os.path.getsize(input_file)
+
+    start_time = time.perf_counter()
+    ranges = split_byte_ranges(input_file, chunk_size)
+    timings["split"] += time.perf_counter() - start_time
+
+    # The groups of each chunk, by partition, as a worker hands them to the writers
+    chunks = []
+    with open(input_file, 'rb') as f:
+        for start, end in ranges:
+            start_time = time.perf_counter()
+            _, _, data = read_message_range(f, start, end, file_size)
+            timings["read"] += time.perf_counter() - start_time
+
+            groups_by_key = {}
+            if engine == "scan":
+                start_time = time.perf_counter()
+                spans = list(iter_group_spans(data))
+                group_bytes = [data[group_start:group_end] for group_start, group_end in spans]
+                timings["split"] += time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                for group in group_bytes:
+                    info = parse_message_info(group.decode('utf-8', errors='replace'))
+                    if info is not None:
+                        groups_by_key.setdefault(by_year(info), []).append(group)
+                timings["classify"] += time.perf_counter() - start_time
+            else:
+                start_time = time.perf_counter()
+                groups = backend.parse(data.decode('utf-8', errors='replace'))
+                timings["parse"] += time.perf_counter() - start_time
+
+                start_time = time.perf_counter()
+                for group in groups:
+                    info = backend.classify(group)
+                    if info is not None:
+                        groups_by_key.setdefault(by_year(info), []).append(backend.serialize(group).encode('utf-8'))
+                timings["classify"] += time.perf_counter() - start_time
+            chunks.append(groups_by_key)
+
+    # Hand the chunks to the parser's writer threads as the workers do. The
+    # queues are unbounded, so queueing is timed without waiting for the
+    # writers, and the writers time every batch they write in run_metrics.
+    parser.extract_html_parts(input_file)
+    run_metrics.reset(True)
+    try:
+        parser.start_output(output_dir, queue_size=0, backend=backend.name)
+        try:
+            start_time = time.perf_counter()
+            for groups_by_key in chunks:
+                parser.put_groups_by_key(groups_by_key)
+            timings["queue"] += time.perf_counter() - start_time
+        finally:
+            parser.finish_output()
+        timings["write"] += sum(histogram["sum"] for histogram in run_metrics.snapshot()["histograms"]
+                                if histogram["name"] == "stage_seconds" and histogram["labels"] == {"stage": "write"})
+    finally:
+        run_metrics.reset(False)
+
+    return timings
+
+def end_to_end_child(result_queue, input_file, output_dir, options):
+    """Runs parse_discord_html in a child process and reports its time and peak RSS"""
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = sys.stderr = devnull
+        start_time = time.perf_counter()
+        parse_discord_html(input_file, output_dir, options["workers"], options["chunk_size"],
+                           options["mode"], options["engine"], backend=options["backend"])
+        elapsed = time.perf_counter() - start_time
+    own, children = peak_rss()
+    result_queue.put({"seconds": elapsed, "peak_rss": own, "peak_rss_children": children})
+
+def process_context():
+    """
+    Returns the multiprocessing context for end-to-end runs.
+
+    Linux carries a process's peak RSS over into the children it forks, so
+    runs are started from a forkserver that is launched while this process
+    is still small. Without forkserver, processes are spawned.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+def run_end_to_end(input_file, output_dir, options):
+    """Runs one end-to-end configuration in a fresh process so its peak RSS is its own"""
+    context = process_context()
+    result_queue = context.Queue()
+    process = context.Process(target=end_to_end_child, args=(result_queue, input_file, output_dir, options))
+    process.start()
+    try:
+        while True:
+            try:
+                return result_queue.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"Benchmark run failed with exit code {process.exitcode}: {options}")
+    finally:
+        process.join()
+
+def run_benchmark(input_file, output_dir, engines, modes, chunk_sizes, worker_counts, repeat, backend):
+    """Run stage timings, keeping the best of repeat runs, and end-to-end runs, keeping their median"""
+    file_size = os.path.getsize(input_file)
+    groups, messages = count_input(input_file)
+    backend = resolve_backend(backend)
+
     print(f"File: {input_file}")
     print(f"Size: {format_size(file_size)}")
-    print(f"Lines: {line_count:,}")
-    print("\nStarting performance tests...")
-    
-    total_runs = len(chunk_sizes) * len(worker_counts)
-    run_count = 0
-    
-    for chunk_size in chunk_sizes:
-        for workers in worker_counts:
-            run_count += 1
-            print(f"\nTest {run_count}/{total_runs}: chunk_size={chunk_size}MB, workers={workers}")
-            
-            # Clear memory cache before each test (Linux only)
-            if sys.platform.startswith('linux'):
-                os.system('sync; echo 3 > /proc/sys/vm/drop_caches')
-            
-            # Run command and measure time
-            output_path = os.path.join(output_dir, f"benchmark_c{chunk_size}_w{workers}")
-            os.makedirs(output_path, exist_ok=True)
-            
-            # Calculate minimum iterations to ensure test runs for at least 2 seconds
-            # For small files, we'll run multiple iterations to get more accurate measurements
-            min_iterations = 1
-            if file_size < 50 * 1024 * 1024:  # if file is smaller than 50MB
-                min_iterations = max(5, int(50 * 1024 * 1024 / file_size))
-                print(f"Small file detected. Running {min_iterations} iterations for accurate measurement")
-            
-            # Initialize measurement variables
-            total_elapsed_time = 0
-            total_memory_used = 0
-            successful_runs = 0
-            
-            for i in range(min_iterations):
-                print(f"  Iteration {i+1}/{min_iterations}")
-                
-                # Monitor memory before
-                start_memory = psutil.virtual_memory().used
-                start_time = time.perf_counter()  # More precise time measurement
-                
-                cmd = [
-                    sys.executable, "-m", "dsparser",
-                    "--input", input_file,
-                    "--output", output_path,
-                    "--chunk-size", str(chunk_size),
-                    "--workers", str(workers)
-                ]
-                
-                process = subprocess.Popen(
-                    cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    universal_newlines=True
-                )
-                
-                stdout, stderr = process.communicate()
-                
-                end_time = time.perf_counter()
-                end_memory = psutil.virtual_memory().used
-                
-                # Check if process completed successfully
-                if process.returncode != 0:
-                    print(f"  Error executing command: {stderr}")
-                    continue
-                
-                # Calculate measurements
-                elapsed_time = end_time - start_time
-                memory_used = end_memory - start_memory
-                
-                # Print iteration results
-                print(f"  Time: {elapsed_time:.2f} sec")
-                print(f"  Memory: {format_size(memory_used)}")
-                
-                # Accumulate measurements
-                total_elapsed_time += elapsed_time
-                total_memory_used += memory_used
-                successful_runs += 1
-            
-            # Skip this configuration if all runs failed
-            if successful_runs == 0:
-                print("  All iterations failed for this configuration. Skipping.")
-                continue
-            
-            # Calculate average metrics
-            avg_elapsed_time = total_elapsed_time / successful_runs
-            avg_memory_used = total_memory_used / successful_runs
-            
-            throughput = file_size / avg_elapsed_time
-            lines_per_sec = line_count / avg_elapsed_time
-            
-            results.append({
-                'chunk_size': chunk_size,
-                'workers': workers,
-                'time': avg_elapsed_time,
-                'memory': avg_memory_used,
-                'throughput': throughput,
-                'lines_per_sec': lines_per_sec
-            })
-            
-            print(f"Average results after {successful_runs} iterations:")
-            print(f"Time: {avg_elapsed_time:.2f} sec")
-            print(f"Memory: {format_size(avg_memory_used)}")
-            print(f"Speed: {format_size(throughput)}/sec")
-            print(f"Lines/sec: {lines_per_sec:.2f}")
-    
+    print(f"Message groups: {groups:,}, messages: {messages:,}")
+    print(f"Soup engine backend: {backend.name}")
+
+    results = {
+        "version": RESULTS_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": multiprocessing.cpu_count(),
+        "input": {"file": os.path.basename(input_file), "size": file_size, "groups": groups, "messages": messages},
+        "backend": backend.name,
+        "stages": {},
+        "runs": [],
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="dsparser-benchmark-", dir=output_dir)
+    try:
+        print("\nStage timings (single thread, best of runs):")
+        for engine in engines:
+            best = None
+            for _ in range(repeat):
+                timings = time_stages(input_file, engine, chunk_sizes[0], work_dir, backend)
+                best = timings if best is None else {stage: min(best[stage], timings[stage]) for stage in STAGES}
+            results["stages"][engine] = {
+                stage: {"seconds": seconds, "groups_per_sec": groups / seconds if seconds else None}
+                for stage, seconds in best.items()
+            }
+            print(f"  {engine}: " + ", ".join(f"{stage} {best[stage]:.3f}s" for stage in STAGES))
+
+        print("\nEnd-to-end runs (median of runs):")
+        for engine in engines:
+            for mode in modes:
+                for chunk_size in chunk_sizes:
+                    for workers in worker_counts:
+                        options = {"engine": engine, "mode": mode, "chunk_size": chunk_size, "workers": workers,
+                                   "backend": backend.name}
+                        runs = [run_end_to_end(input_file, os.path.join(work_dir, "output"), options) for _ in range(repeat)]
+                        seconds = statistics.median(run["seconds"] for run in runs)
+                        peak = max(run["peak_rss"] or 0 for run in runs)
+                        run = dict(options, seconds=seconds,
+                                   groups_per_sec=groups / seconds,
+                                   messages_per_sec=messages / seconds,
+                                   bytes_per_sec=file_size / seconds,
+                                   peak_rss=peak or None,
+                                   peak_rss_children=max(run["peak_rss_children"] or 0 for run in runs) or None)
+                        results["runs"].append(run)
+                        print(f"  {engine}/{mode} chunk={chunk_size}MB workers={workers}: "
+                              f"{run['seconds']:.2f}s, {run['messages_per_sec']:,.0f} messages/sec, "
+                              f"{format_size(run['bytes_per_sec'])}/sec, peak RSS {format_size(peak)}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
     return results
 
+def metric_rates(results):
+    """Flattens results to {metric name: rate}, where a higher rate is better"""
+    rates = {}
+    for engine, stages in results.get("stages", {}).items():
+        for stage, timing in stages.items():
+            if timing.get("groups_per_sec") and timing["seconds"] >= MIN_COMPARED_SECONDS:
+                rates[f"stage/{engine}/{stage}"] = timing["groups_per_sec"]
+    for run in results.get("runs", []):
+        if run["seconds"] >= MIN_COMPARED_RUN_SECONDS:
+            rates[f"run/{run['engine']}/{run['mode']}/c{run['chunk_size']}/w{run['workers']}"] = run["groups_per_sec"]
+    return rates
+
+def compare_with_baseline(results, baseline, threshold):
+    """
+    Compares results with a baseline.
+
+    Returns:
+        List of (metric, baseline rate, current rate) for metrics that are
+        more than threshold slower than the baseline
+    """
+    current = metric_rates(results)
+    previous = metric_rates(baseline)
+    regressions = []
+
+    print(f"\nComparison with baseline (threshold {threshold:.0%}):")
+    for metric in sorted(set(current) & set(previous)):
+        change = current[metric] / previous[metric] - 1
+        flag = "REGRESSION" if change < -threshold else ""
+        print(f"  {metric:<40} {change:+7.1%} {flag}")
+        if flag:
+            regressions.append((metric, previous[metric], current[metric]))
+
+    missing = sorted(set(previous) - set(current))
+    if missing:
+        print(f"  Not measured in this run: {', '.join(missing)}")
+    return regressions
+
 def plot_results(results, output_dir):
-    """Create plots from benchmark results"""
-    if not results:
-        print("No valid benchmark results to plot.")
+    """Plot stage timings per engine, if matplotlib is installed"""
+    try:
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib is not installed, skipping plots")
         return
-        
-    plt.figure(figsize=(15, 10))
-    
-    # Group results by workers
-    worker_groups = {}
-    for r in results:
-        if r['workers'] not in worker_groups:
-            worker_groups[r['workers']] = []
-        worker_groups[r['workers']].append(r)
-    
-    # Plot 1: Time by chunk size and workers
-    plt.subplot(2, 2, 1)
-    for workers, group in worker_groups.items():
-        chunk_sizes = [r['chunk_size'] for r in group]
-        times = [r['time'] for r in group]
-        plt.plot(chunk_sizes, times, 'o-', label=f"{workers} workers")
-    
-    plt.title('Processing Time')
-    plt.xlabel('Chunk Size (MB)')
+
+    plt.figure(figsize=(10, 6))
+    engines = list(results["stages"])
+    bottoms = [0.0] * len(engines)
+    for stage in STAGES:
+        seconds = [results["stages"][engine][stage]["seconds"] for engine in engines]
+        plt.bar(engines, seconds, bottom=bottoms, label=stage)
+        bottoms = [bottom + value for bottom, value in zip(bottoms, seconds)]
+
+    plt.title('Time per Stage')
     plt.ylabel('Time (sec)')
-    plt.grid(True)
-    plt.legend()
-    
-    # Plot 2: Throughput
-    plt.subplot(2, 2, 2)
-    for workers, group in worker_groups.items():
-        chunk_sizes = [r['chunk_size'] for r in group]
-        throughputs = [r['throughput'] / 1024 / 1024 for r in group]  # MB/s
-        plt.plot(chunk_sizes, throughputs, 'o-', label=f"{workers} workers")
-    
-    plt.title('Processing Speed')
-    plt.xlabel('Chunk Size (MB)')
-    plt.ylabel('Speed (MB/sec)')
-    plt.grid(True)
     plt.legend()
-    
-    # Plot 3: Memory usage
-    plt.subplot(2, 2, 3)
-    for workers, group in worker_groups.items():
-        chunk_sizes = [r['chunk_size'] for r in group]
-        memory = [r['memory'] / 1024 / 1024 for r in group]  # MB
-        plt.plot(chunk_sizes, memory, 'o-', label=f"{workers} workers")
-    
-    plt.title('Memory Usage')
-    plt.xlabel('Chunk Size (MB)')
-    plt.ylabel('Memory (MB)')
-    plt.grid(True)
-    plt.legend()
-    
-    # Plot 4: Lines per second
-    plt.subplot(2, 2, 4)
-    for workers, group in worker_groups.items():
-        chunk_sizes = [r['chunk_size'] for r in group]
-        lines = [r['lines_per_sec'] for r in group]
-        plt.plot(chunk_sizes, lines, 'o-', label=f"{workers} workers")
-    
-    plt.title('Processing Rate')
-    plt.xlabel('Chunk Size (MB)')
-    plt.ylabel('Lines/sec')
-    plt.grid(True)
-    plt.legend()
-    
     plt.tight_layout()
-    plt.savefig(os.path.join(output_dir, 'benchmark_results.png'), dpi=300)
-    plt.savefig(os.path.join(output_dir, 'benchmark_results.pdf'))
-    
-    # Create summary table for README
-    if results:
-        best_result = max(results, key=lambda x: x['throughput'])
-        with open(os.path.join(output_dir, 'benchmark_summary.md'), 'w', encoding='utf-8') as f:
-            f.write("# DSParser Benchmark Results\n\n")
-            f.write(f"File: {best_result['chunk_size']} MB, {best_result['workers']} workers\n\n")
-            f.write("| Metric | Value |\n")
-            f.write("|---------|----------|\n")
-            f.write(f"| Processing Speed | {format_size(best_result['throughput'])}/sec |\n")
-            f.write(f"| Messages per second | {best_result['lines_per_sec']:.2f} |\n")
-            f.write(f"| Processing time | {best_result['time']:.2f} sec |\n")
-            f.write(f"| Memory usage | {format_size(best_result['memory'])} |\n\n")
-            
-            f.write("## Complete Results\n\n")
-            f.write("| Chunk Size (MB) | Workers | Time (sec) | Memory | MB/sec | Lines/sec |\n")
-            f.write("|-----------------|---------|------------|--------|--------|-----------|\n")
-            
-            for r in sorted(results, key=lambda x: (x['chunk_size'], x['workers'])):
-                f.write(f"|        {r['chunk_size']}        |    {r['workers']}    |    {r['time']:.2f}    |{format_size(r['memory'])} |  {r['throughput']/1024/1024:.2f}  |  {r['lines_per_sec']:.2f} |\n")
+    plt.savefig(os.path.join(output_dir, 'benchmark_stages.png'), dpi=150)
 
 def main():
     parser = argparse.ArgumentParser(description='DSParser Benchmark Tool')
-    parser.add_argument('--input', '-i', required=True, help='Input HTML file to parse')
+    parser.add_argument('--input', '-i', help='Input HTML file to parse; a synthetic export is generated if omitted')
     parser.add_argument('--output', '-o', default='benchmark_results', help='Output directory for benchmark results')
-    parser.add_argument('--chunk-sizes', '-c', type=int, nargs='+', default=[5, 10, 20, 50], help='Chunk sizes to test (MB)')
+    parser.add_argument('--groups', '-g', type=int, default=20000, help='Message groups in the synthetic export')
+    parser.add_argument('--start-year', type=int, default=2017, help='First year of the synthetic export')
+    parser.add_argument('--end-year', type=int, default=2022, help='Last year of the synthetic export')
+    parser.add_argument('--engines', '-e', nargs='+', default=['soup', 'scan'], choices=['soup', 'scan'], help='Engines to test')
+    parser.add_argument('--backend', default='auto', choices=['auto'] + list(BACKENDS),
+                        help='HTML parser backend of the soup engine (default: auto)')
+    parser.add_argument('--modes', '-m', nargs='+', default=['threads'], choices=['threads', 'processes'], help='Execution modes to test')
+    parser.add_argument('--chunk-sizes', '-c', type=int, nargs='+', default=[10], help='Chunk sizes to test (MB)')
     parser.add_argument('--workers', '-w', type=int, nargs='+', help='Worker counts to test')
-    parser.add_argument('--quick', '-q', action='store_true', help='Run a quick benchmark with fewer configurations')
-    
+    parser.add_argument('--repeat', '-r', type=int, default=3, help='Runs per configuration; the best stage timings and the median run are kept')
+    parser.add_argument('--json', help='Path of the results JSON (default: <output>/benchmark_results.json)')
+    parser.add_argument('--baseline', '-b', help='Baseline results JSON to compare against')
+    parser.add_argument('--threshold', '-t', type=float, default=0.10, help='Allowed slowdown against the baseline (default: 0.10)')
+    parser.add_argument('--save-baseline', help='Also save the results as a new baseline at this path')
+    parser.add_argument('--plot', action='store_true', help='Plot stage timings (needs matplotlib)')
+
     args = parser.parse_args()
-    
-    if not os.path.exists(args.input):
-        print(f"Error: File {args.input} not found")
+
+    # Start the forkserver before this process grows, see process_context()
+    if process_context().get_start_method() == "forkserver":
+        from multiprocessing import forkserver
+        forkserver.ensure_running()
+
+    os.makedirs(args.output, exist_ok=True)
+
+    input_file = args.input
+    if input_file is None:
+        input_file = os.path.join(args.output, 'synthetic_export.html')
+        groups, messages = generate_export(input_file, args.groups, args.start_year, args.end_year)
+        print(f"Generated synthetic export with {groups:,} message groups and {messages:,} messages")
+    elif not os.path.exists(input_file):
+        print(f"Error: File {input_file} not found")
         return 1
-    
-    # Set default worker counts based on CPU or quick mode
+
     if args.workers is None:
-        if args.quick:
-            args.workers = [1, multiprocessing.cpu_count()]
-        else:
-            cpu_count = multiprocessing.cpu_count()
-            args.workers = [1, max(1, cpu_count//4), max(1, cpu_count//2), cpu_count]
-    
-    # Use fewer chunk sizes in quick mode
-    if args.quick and not args.chunk_sizes:
-        args.chunk_sizes = [10, 50]
-    
-    os.makedirs(args.output, exist_ok=True)
-    
-    results = run_benchmark(args.input, args.output, args.chunk_sizes, args.workers)
-    plot_results(results, args.output)
-    
-    print("\nBenchmark completed! Results saved to:", args.output)
+        args.workers = [1, multiprocessing.cpu_count()] if multiprocessing.cpu_count() > 1 else [1]
+
+    results = run_benchmark(input_file, args.output, args.engines, args.modes,
+                            args.chunk_sizes, args.workers, max(1, args.repeat), args.backend)
+
+    json_path = args.json or os.path.join(args.output, 'benchmark_results.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to: {json_path}")
+
+    if args.save_baseline:
+        shutil.copyfile(json_path, args.save_baseline)
+        print(f"Baseline saved to: {args.save_baseline}")
+
+    if args.plot:
+        plot_results(results, args.output)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get("version") != RESULTS_VERSION:
+            print(f"Warning: the baseline has results version {baseline.get('version')}, not {RESULTS_VERSION}")
+        if baseline.get("input", {}).get("groups") != results["input"]["groups"]:
+            print("Warning: the baseline was measured on a different input")
+        if baseline.get("backend", "html.parser") != results["backend"]:
+            print(f"Warning: the baseline was measured with the {baseline.get('backend', 'html.parser')} backend")
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        print("\nNo regressions")
+
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Synthetic Discord export generator
+
+Writes HTML files in the layout of DiscordChatExporter exports, with a
+configurable number of message groups spread over a range of years, so
+benchmarks do not depend on a private export.
+"""
+
+import random
+import argparse
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+HEADER = (
+    '<!DOCTYPE html>\n<html lang="en">\n<head>\n<title>Synthetic Guild - general</title>\n'
+    '<meta charset="utf-8">\n<style>body { background-color: #36393e; color: #dcddde; }</style>\n'
+    '</head>\n<body>\n<div class="preamble">\n<div class="preamble__entries-container">\n'
+    '<div class="preamble__entry">Synthetic Guild</div>\n<div class="preamble__entry">general</div>\n'
+    '</div>\n</div>\n<div class="chatlog">\n'
+)
+
+FOOTER = '</div>\n<div class="postamble">\n<div class="postamble__entry">Exported {count} message(s)</div>\n</div>\n</body>\n</html>\n'
+
+GROUP_START = (
+    '<div class="chatlog__message-group">\n'
+    '<div class="chatlog__author-avatar-container"><img class="chatlog__author-avatar" '
+    'src="https://cdn.discordapp.com/avatars/{author_id}/avatar.png" alt="Avatar"></div>\n'
+    '<div class="chatlog__messages">\n'
+    '<span class="chatlog__author-name" title="{author}" data-user-id="{author_id}">{name}</span>\n'
+    '<span class="chatlog__timestamp">{date} {time}</span>\n'
+)
+
+MESSAGE = (
+    '<div class="chatlog__message " data-message-id="{message_id}" id="message-{message_id}" '
+    'title="Message sent: {date} {time}">'
+    '<div class="chatlog__content"><div class="markdown"><span class="preserve-whitespace">{text}</span>'
+    '</div></div></div>\n'
+)
+
+GROUP_END = '</div>\n</div>\n'
+
+# Markup the parser backends must serialize alike, added to every group with edge_cases
+EDGE_CASES = [
+    'edited <!-- message edited -->text<!--no spaces-->',
+    '<svg class="emoji" viewBox="0 0 36 36"><path d="M18 0a18 18 0 1 0 0 36"/></svg> svg',
+    '<table><tr><th>name</th><td>value</td></tr></table>',
+    '<p>first paragraph<p>second paragraph',
+]
+
+WORDS = ["hello", "world", "discord", "message", "export", "parser", "benchmark", "ünïcode", "✓", "<b>bold</b>"]
+
+def generate_export(path, groups=20000, start_year=2017, end_year=2022, authors=50, max_messages=4, seed=1,
+                    edge_cases=False):
+    """
+    Writes a synthetic export and returns the number of message groups and messages.
+
+    Groups are spread evenly over the years from start_year to end_year and
+    are in chronological order, like a real export. With edge_cases, every
+    group gets one more message with markup from EDGE_CASES.
+    """
+    rng = random.Random(seed)
+    years = end_year - start_year + 1
+    message_id = 100000000000000000
+    messages = 0
+
+    with open(path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(HEADER)
+        for index in range(groups):
+            position = index * years * 12 // max(groups, 1)
+            year = start_year + position // 12
+            month = MONTHS[position % 12]
+            day = 1 + (index * 28 * years * 12 // max(groups, 1)) % 28
+            date = f"{day:02d}-{month}-{year % 100:02d}"
+            time = f"{rng.randint(1, 12)}:{rng.randint(0, 59):02d} {rng.choice(['AM', 'PM'])}"
+            author = rng.randint(1, authors)
+
+            f.write(GROUP_START.format(author=f"user{author}#{author:04d}", author_id=400000000000000000 + author,
+                                       name=f"User {author}", date=date, time=time))
+            for _ in range(rng.randint(1, max_messages)):
+                message_id += 1
+                messages += 1
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30)))
+                f.write(MESSAGE.format(message_id=message_id, date=date, time=time, text=text))
+            if edge_cases:
+                message_id += 1
+                messages += 1
+                text = EDGE_CASES[index % len(EDGE_CASES)]
+                f.write(MESSAGE.format(message_id=message_id, date=date, time=time, text=text))
+            f.write(GROUP_END)
+        f.write(FOOTER.format(count=messages))
+
+    return groups, messages
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic Discord export generator')
+    parser.add_argument('output', help='Path of the HTML file to write')
+    parser.add_argument('--groups', '-g', type=int, default=20000, help='Number of message groups')
+    parser.add_argument('--start-year', type=int, default=2017, help='Year of the first messages')
+    parser.add_argument('--end-year', type=int, default=2022, help='Year of the last messages')
+    parser.add_argument('--authors', type=int, default=50, help='Number of distinct authors')
+    parser.add_argument('--max-messages', type=int, default=4, help='Maximum number of messages per group')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed')
+
+    args = parser.parse_args()
+    groups, messages = generate_export(args.output, args.groups, args.start_year, args.end_year,
+                                       args.authors, args.max_messages, args.seed)
+    print(f"Wrote {groups:,} message groups with {messages:,} messages to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Timestamp classifier micro-benchmark
+
+Measures how many message groups per second get their date classified,
+comparing the sequential regex chain that was used before with the
+precompiled TimestampClassifier, with and without its cache.
+"""
+
+import re
+import sys
+import time
+import argparse
+
+from dsparser.stream import iter_message_spans
+from dsparser.utils.html_helpers import month_number, expand_short_year
+from dsparser.utils.timestamps import TimestampClassifier
+
+def parse_date_baseline(message_html):
+    """The previous implementation: up to six uncompiled regexes per group"""
+    timestamp_match = re.search(r'<span class="chatlog__timestamp"[^>]*title="([^"]+)"', message_html)
+    if timestamp_match:
+        date_match = re.search(r"(\d{1,2}) (\w+) (\d{4})", timestamp_match.group(1))
+        if date_match:
+            return date_match.group(3), month_number(date_match.group(2)), int(date_match.group(1))
+
+    message_div_match = re.search(r'title="Message sent:\s*([^"]+)"', message_html)
+    if message_div_match:
+        date_match = re.search(r"(\d{1,2})-(\w+)-(\d{2})", message_div_match.group(1))
+        if date_match:
+            return expand_short_year(date_match.group(3)), month_number(date_match.group(2)), int(date_match.group(1))
+
+    content_match = re.search(r'<span class="chatlog__timestamp"[^>]*>([^<]+)</span>', message_html, re.DOTALL)
+    if content_match:
+        date_string = content_match.group(1).strip()
+        for pattern, order in ((r"(\d{1,2})-(\w+)-(\d{2})", (3, 2, 1)), (r"(\d{1,2})\s+(\w+)\s+(\d{4})", (3, 2, 1)),
+                               (r"(\w+)\s+(\d{1,2}),\s+(\d{4})", (3, 1, 2)), (r"(\d{1,2})/(\d{2})/(\d{4})", (3, 2, 1))):
+            date_match = re.search(pattern, date_string)
+            if date_match:
+                year = date_match.group(order[0])
+                year = expand_short_year(year) if len(year) == 2 else year
+                return year, month_number(date_match.group(order[1])), int(date_match.group(order[2]))
+
+    return None
+
+def load_groups(input_file, limit):
+    """Reads up to limit message groups of the export as text"""
+    with open(input_file, 'rb') as f:
+        data = f.read()
+    groups = []
+    for start, end in iter_message_spans(data):
+        groups.append(data[start:end].decode('utf-8', errors='replace'))
+        if len(groups) >= limit:
+            break
+    return groups, data[:100 * 1024].decode('utf-8', errors='replace')
+
+def measure(name, classify, groups, repeat):
+    """Runs classify over all groups repeat times and prints groups per second"""
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        for group in groups:
+            classify(group)
+    elapsed = time.perf_counter() - start_time
+    rate = len(groups) * repeat / elapsed
+    print(f"{name:<28} {rate:>14,.0f} groups/sec")
+    return rate
+
+def main():
+    parser = argparse.ArgumentParser(description='Timestamp classifier micro-benchmark')
+    parser.add_argument('--input', '-i', required=True, help='Discord HTML export to take message groups from')
+    parser.add_argument('--groups', '-g', type=int, default=20000, help='Maximum number of message groups to use')
+    parser.add_argument('--repeat', '-r', type=int, default=5, help='Number of passes over the groups')
+
+    args = parser.parse_args()
+
+    groups, sample = load_groups(args.input, args.groups)
+    if not groups:
+        print(f"Error: no message groups found in {args.input}")
+        return 1
+    print(f"{len(groups):,} message groups, {args.repeat} passes\n")
+
+    baseline = measure("regex chain (before)", parse_date_baseline, groups, args.repeat)
+
+    uncached = TimestampClassifier(cache_size=0)
+    uncached.detect(sample)
+    measure("classifier, no cache", uncached.classify_html, groups, args.repeat)
+
+    classifier = TimestampClassifier()
+    print(f"\nDetected format: {classifier.detect(sample)}")
+    cached = measure("classifier with cache", classifier.classify_html, groups, args.repeat)
+
+    mismatches = sum(1 for group in groups if classifier.classify_html(group) != parse_date_baseline(group))
+    print(f"\nSpeedup: {cached / baseline:.2f}x, results differing from baseline: {mismatches}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
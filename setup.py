@@ -23,14 +23,21 @@ setup(
         "License :: OSI Approved :: MIT License",
         "Operating System :: OS Independent",
     ],
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=[
         "beautifulsoup4>=4.9.0",
         "tqdm>=4.45.0",
     ],
+    extras_require={
+        "zstd": ["zstandard>=0.15.0"],
+        "lxml": ["lxml>=4.6.0"],
+        "selectolax": ["selectolax>=0.3.17"],
+    },
     entry_points={
         "console_scripts": [
             "dsparser=dsparser.cli:main",
+            "dsparser-daemon=dsparser.daemon:main",
+            "dsparser-client=dsparser.client:main",
         ],
     },
 ) 
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Asyncio entry point for parsing an export as it arrives, for example from an HTTP request body.
+
+The stream is cut into chunks on message group boundaries as data comes
+in. Chunks are parsed in an executor and their message groups are written
+by a dedicated writer thread, so the event loop is never blocked on
+parsing or on disk I/O. At most max_pending chunks are in flight, and
+reading from the stream waits while that many are being processed.
+"""
+
+import asyncio
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dsparser.parser import scan_groups_by_key, PartitionFiles, DEFAULT_MAX_OPEN_FILES
+from dsparser.partition import resolve_partition
+from dsparser.utils.html_helpers import extract_html_header_footer
+from dsparser.utils.reader import StreamChunker
+
+
+READ_SIZE = 64 * 1024
+
+
+async def iter_stream_blocks(stream, read_size=READ_SIZE):
+    """
+    Yields blocks of bytes from an async byte stream.
+    
+    Args:
+        stream: Object with an async read(n) method, such as aiohttp's
+            request.content, or an async iterable of bytes
+        read_size: Block size to request from read(n)
+    """
+    if hasattr(stream, "read"):
+        while True:
+            block = await stream.read(read_size)
+            if not block:
+                return
+            yield block
+    else:
+        async for block in stream:
+            yield block
+
+
+def partition_writer(output_dir, header, footer, max_open_files=DEFAULT_MAX_OPEN_FILES):
+    """
+    Creates blocking functions that write message groups to partition files.
+    
+    The files are handled by the PartitionFiles of the parser's writer
+    threads. Both functions must be called from one thread at a time.
+    
+    Returns:
+        Tuple (write, close), where write takes a dictionary of message groups
+        by partition key and close writes the footer to every file
+    """
+    header = header.encode('utf-8')
+    files = PartitionFiles(output_dir, lambda channel: header, footer.encode('utf-8'), max_open_files)
+    
+    def write(groups_by_key):
+        for key, groups in groups_by_key.items():
+            files.write(key, groups, sum(len(group) for group in groups))
+    
+    return write, files.close
+
+
+async def parse_discord_html_async(stream, output_dir, chunk_size_mb=1, partition="year", executor=None,
+                                   max_pending=4, max_open_files=DEFAULT_MAX_OPEN_FILES):
+    """
+    Parses a Discord HTML export from an async byte stream and splits it into partition files.
+    
+    Message groups are written to each file in input order. Chunks are
+    parsed with the scan engine, which copies message groups unchanged.
+    
+    Args:
+        stream: Object with an async read(n) method or an async iterable of bytes
+        output_dir: Folder to save output files
+        chunk_size_mb: Size of the chunks handed to the executor, in MB
+        partition: Partitioning scheme name, "module:function" reference or callable
+        executor: Executor for parsing chunks; the loop's default executor if None.
+            A ProcessPoolExecutor parses on several cores, but then the
+            partition key function must be importable by the worker processes
+        max_pending: Maximum number of chunks being parsed at once
+        max_open_files: Maximum number of output files kept open at once
+    
+    Returns:
+        Number of bytes read from the stream
+    """
+    loop = asyncio.get_running_loop()
+    key_function = resolve_partition(partition)
+    chunk_size = max(int(chunk_size_mb * 1024 * 1024), 1)
+    
+    # One writer thread keeps file writes ordered without blocking the event loop
+    writer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dsparser-writer")
+    await loop.run_in_executor(writer_executor, lambda: os.makedirs(output_dir, exist_ok=True))
+    
+    # The whole header is kept, however large its stylesheets and embedded images are
+    chunker = StreamChunker(chunk_size, keep_header=True)
+    write = close = None
+    pending = deque()
+    total_size = 0
+    
+    async def write_oldest():
+        groups_by_key = await pending.popleft()
+        await loop.run_in_executor(writer_executor, write, groups_by_key)
+    
+    async def submit(chunk):
+        while len(pending) >= max_pending:
+            await write_oldest()
+        pending.append(loop.run_in_executor(executor, scan_groups_by_key, chunk, key_function))
+    
+    def start_output(header_bytes):
+        nonlocal write, close
+        header, footer = extract_html_header_footer(header_bytes.decode('utf-8', errors='replace'))
+        write, close = partition_writer(output_dir, header, footer, max_open_files)
+    
+    try:
+        async for block in iter_stream_blocks(stream):
+            total_size += len(block)
+            chunks = chunker.feed(block)
+            if chunker.started and write is None:
+                start_output(chunker.header)
+            for _, chunk in chunks:
+                await submit(chunk)
+        
+        for _, chunk in chunker.finish():
+            await submit(chunk)
+        
+        while pending:
+            await write_oldest()
+        
+        if close is not None:
+            await loop.run_in_executor(writer_executor, close)
+    finally:
+        for future in pending:
+            future.cancel()
+        writer_executor.shutdown(wait=True)
+    
+    return total_size
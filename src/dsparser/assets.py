@@ -0,0 +1,178 @@
+"""
+Shared assets: stores the stylesheets and embedded images of export headers,
+and optionally the embedded media of message groups, once in a
+content-addressed folder that every output file links to.
+"""
+
+import base64
+import binascii
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+ASSET_DIR = "assets"
+# Assets known to be stored, so repeated media skip the check for their file
+RECENT_ASSETS = 4096
+
+# Smaller stylesheets and data: URIs stay inline, where they cost less than a file
+MIN_ASSET_BYTES = 512
+
+STYLE_BLOCK = re.compile(r'<style([^>]*)>(.*?)</style\s*>', re.DOTALL | re.IGNORECASE)
+DATA_URI = re.compile(r'data:([\w.+-]+/[\w.+-]+)((?:;[\w.+-]+=[\w.+-]+)*);base64,([A-Za-z0-9+/]+={0,2})')
+DATA_URI_BYTES = re.compile(DATA_URI.pattern.encode('ascii'))
+TYPE_ATTRIBUTE = re.compile(r'\s+type\s*=\s*(?:"[^"]*"|\'[^\']*\'|\S+)', re.IGNORECASE)
+
+
+def current_umask():
+    """Returns the umask of the process, which can only be read by setting it"""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+# Mode of files created with open(); mkstemp creates files only their owner can read.
+# Read once at import, since reading the umask briefly changes it for every thread
+FILE_MODE = 0o666 & ~current_umask()
+
+
+def asset_extension(mime_type):
+    """Returns the file extension for a MIME type, .bin if it is not known"""
+    return mimetypes.guess_extension(mime_type.lower()) or ".bin"
+
+
+class AssetStore:
+    """
+    Content-addressed folder of asset files.
+    
+    Files are named by a hash of their content, so each asset is stored
+    once however many output files refer to it. Files are written to a
+    temporary name and renamed, so threads and processes can share a store.
+    The names of recently stored assets are kept in an LRU cache.
+    """
+    
+    def __init__(self, directory, recent_size=RECENT_ASSETS):
+        self.directory = directory
+        self.recent_size = recent_size
+        self.recent = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def __repr__(self):
+        return f"AssetStore({self.directory!r})"
+    
+    def __reduce__(self):
+        # Worker processes get a store of the same folder with a cache of their own
+        return AssetStore, (self.directory, self.recent_size)
+    
+    def store(self, data, extension):
+        """
+        Stores an asset unless the store already has it.
+        
+        Args:
+            data: Content of the asset
+            extension: File extension, for example ".css"
+        
+        Returns:
+            File name of the asset in the store
+        """
+        import hashlib
+        name = hashlib.blake2b(data, digest_size=16).hexdigest() + extension
+        with self.lock:
+            if name in self.recent:
+                self.recent.move_to_end(name)
+                return name
+        
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            try:
+                with os.fdopen(descriptor, 'wb') as file:
+                    file.write(data)
+                os.chmod(temporary_path, FILE_MODE)
+                os.replace(temporary_path, path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+        
+        with self.lock:
+            self.recent[name] = None
+            if len(self.recent) > self.recent_size:
+                self.recent.popitem(last=False)
+        return name
+    
+    def replace_data_uris(self, text, prefix=""):
+        """
+        Moves the large base64 data: URIs in HTML or CSS text to asset files.
+        
+        Args:
+            text: HTML or CSS text, as a string or as UTF-8 bytes
+            prefix: Path from the document to the store, including a trailing slash
+        
+        Returns:
+            The text with each moved data: URI replaced by the path of its file
+        """
+        is_bytes = isinstance(text, bytes)
+        
+        def replace(match):
+            encoded = match.group(3)
+            if len(encoded) * 3 // 4 < MIN_ASSET_BYTES:
+                return match.group()
+            try:
+                data = base64.b64decode(encoded, validate=True)
+            except binascii.Error:
+                return match.group()
+            mime_type = match.group(1).decode('ascii') if is_bytes else match.group(1)
+            path = prefix + self.store(data, asset_extension(mime_type))
+            return path.encode('ascii') if is_bytes else path
+        
+        return (DATA_URI_BYTES if is_bytes else DATA_URI).sub(replace, text)
+    
+    def extract_header(self, header, prefix=""):
+        """
+        Moves the stylesheets and embedded images of an export header to the store.
+        
+        Large <style> blocks become <link> elements to .css files, whose own
+        data: URIs are stored next to them, and large data: URIs left in the
+        header become paths of image files.
+        
+        Args:
+            header: HTML of the export up to the chatlog
+            prefix: Path from the output file to the folder holding the store,
+                including a trailing slash, for example "../" for channel subfolders
+        
+        Returns:
+            The header referring to the stored assets
+        """
+        asset_prefix = f"{prefix}{ASSET_DIR}/"
+        
+        def replace_style(match):
+            css = match.group(2)
+            if len(css.encode('utf-8')) < MIN_ASSET_BYTES:
+                return match.group()
+            name = self.store(self.replace_data_uris(css).encode('utf-8'), ".css")
+            attributes = TYPE_ATTRIBUTE.sub("", match.group(1))
+            return f'<link rel="stylesheet"{attributes} href="{asset_prefix}{name}">'
+        
+        header = STYLE_BLOCK.sub(replace_style, header)
+        return self.replace_data_uris(header, asset_prefix)
+
+
+def store_group_media(groups_by_key, store):
+    """
+    Moves the large data: URIs of serialized message groups to an asset store.
+    
+    Groups are rewritten in place to refer to the stored files, relative to
+    the partition file they are written to.
+    
+    Args:
+        groups_by_key: Dictionary of message group HTML bytes by partition key
+        store: AssetStore in the output folder
+    """
+    for key, groups in groups_by_key.items():
+        # Partitions of a channel (batch mode) are written to the channel's subfolder
+        prefix = f"../{ASSET_DIR}/" if isinstance(key, tuple) else f"{ASSET_DIR}/"
+        groups[:] = [store.replace_data_uris(group, prefix) for group in groups]
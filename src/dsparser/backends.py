@@ -0,0 +1,331 @@
+"""
+HTML parser backends of the soup engine.
+
+A backend finds the message groups in decoded HTML, classifies them and
+serializes them back to HTML. Every backend serializes groups the way
+BeautifulSoup does, but the parsers build different trees from some
+markup: selectolax keeps the case of SVG attributes like viewBox and adds
+<tbody> to tables, and html.parser nests an unclosed <p> where lxml and
+selectolax close it. html.parser is the reference backend. "auto" uses the
+fastest installed backend that finds the same message groups as the
+reference in CONFORMANCE_SAMPLE, with the same partition keys and the same
+normalized markup, see conformance_differences().
+"""
+
+import functools
+import importlib.util
+import re
+from collections import namedtuple
+from html.parser import HTMLParser
+
+from dsparser.partition import MessageInfo
+from dsparser.utils.timestamps import timestamp_classifier, MESSAGE_SENT_PREFIX
+
+
+GROUP_CLASS = "chatlog__message-group"
+AUTHOR_CLASSES = ["chatlog__author", "chatlog__author-name"]
+MESSAGE_SENT = re.compile(r'^Message sent:')
+
+# BeautifulSoup keeps script and style text unescaped
+UNESCAPED_TEXT_ELEMENTS = frozenset(["script", "style"])
+
+SoupFormatting = namedtuple("SoupFormatting", ["void_elements", "multi_valued_attributes", "entities"])
+
+
+@functools.lru_cache(maxsize=None)
+def soup_formatting():
+    """
+    Returns how BeautifulSoup formats HTML, importing bs4 on first use.
+    
+    BeautifulSoup writes void elements as <br/>, normalizes the whitespace
+    of multi-valued attributes like class and escapes text with its
+    EntitySubstitution.
+    """
+    from bs4.builder import HTMLTreeBuilder
+    from bs4.dammit import EntitySubstitution
+    
+    return SoupFormatting(
+        frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS),
+        HTMLTreeBuilder.DEFAULT_CDATA_LIST_ATTRIBUTES,
+        EntitySubstitution,
+    )
+
+
+class SoupBackend:
+    """BeautifulSoup with one of its tree builders"""
+    
+    def __init__(self, name, builder, module=None):
+        self.name = name
+        self.builder = builder
+        self.module = module
+    
+    def __repr__(self):
+        return f"SoupBackend({self.name!r})"
+    
+    def __reduce__(self):
+        # Worker processes get the backend by name
+        return resolve_backend, (self.name,)
+    
+    def available(self):
+        return self.module is None or importlib.util.find_spec(self.module) is not None
+    
+    def parse(self, content):
+        """Parses HTML text and returns its message group elements"""
+        from bs4 import BeautifulSoup, SoupStrainer
+        soup = BeautifulSoup(content, self.builder, parse_only=SoupStrainer("div", class_=GROUP_CLASS))
+        return soup.find_all("div", class_=GROUP_CLASS)
+    
+    def classify(self, group, with_author=False):
+        """Returns the MessageInfo of a message group from its first timestamp, or None if it has no date"""
+        date_parts = timestamp_classifier.classify_first(self.timestamps(group))
+        if date_parts is None:
+            return None
+        
+        author = None
+        if with_author:
+            author_span = group.find("span", class_=AUTHOR_CLASSES)
+            if author_span is not None:
+                author = author_span.get("title") or author_span.text.strip()
+        
+        return MessageInfo(*date_parts, author)
+    
+    def timestamps(self, group):
+        """Yields the timestamps of a message group in the order classify_html() tries them: titles first, then the text"""
+        timestamp_span = group.find("span", class_="chatlog__timestamp")
+        if timestamp_span is not None:
+            yield timestamp_span.get("title")
+        message = group.find(title=MESSAGE_SENT)
+        if message is not None:
+            yield MESSAGE_SENT_PREFIX.sub("", message["title"])
+        if timestamp_span is not None:
+            yield timestamp_span.text
+    
+    def serialize(self, group):
+        """Returns the HTML of a message group"""
+        return str(group)
+
+
+class LexborBackend:
+    """The lexbor HTML5 parser of selectolax, written in C"""
+    
+    name = "selectolax"
+    
+    def __repr__(self):
+        return "LexborBackend()"
+    
+    def __reduce__(self):
+        return resolve_backend, (self.name,)
+    
+    def available(self):
+        return importlib.util.find_spec("selectolax") is not None
+    
+    def parse(self, content):
+        """Parses HTML text and returns its message group nodes"""
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser(content).css(f"div.{GROUP_CLASS}")
+    
+    def classify(self, group, with_author=False):
+        """Returns the MessageInfo of a message group from its first timestamp, or None if it has no date"""
+        date_parts = timestamp_classifier.classify_first(self.timestamps(group))
+        if date_parts is None:
+            return None
+        
+        author = None
+        if with_author:
+            author_span = group.css_first(", ".join(f"span.{name}" for name in AUTHOR_CLASSES))
+            if author_span is not None:
+                author = author_span.attributes.get("title") or author_span.text().strip()
+        
+        return MessageInfo(*date_parts, author)
+    
+    def timestamps(self, group):
+        """Yields the timestamps of a message group in the order classify_html() tries them: titles first, then the text"""
+        timestamp_span = group.css_first("span.chatlog__timestamp")
+        if timestamp_span is not None:
+            yield timestamp_span.attributes.get("title")
+        message = group.css_first('[title^="Message sent:"]')
+        if message is not None:
+            yield MESSAGE_SENT_PREFIX.sub("", message.attributes["title"])
+        if timestamp_span is not None:
+            yield timestamp_span.text()
+    
+    def serialize(self, group):
+        """Returns the HTML of a message group, formatted like BeautifulSoup formats it"""
+        parts = []
+        serialize_node(group, parts, soup_formatting())
+        return "".join(parts)
+
+
+def serialize_node(node, parts, formatting):
+    """Appends the HTML of a selectolax node and its descendants to parts, formatted as described by a SoupFormatting"""
+    tag = node.tag
+    if tag == "-text":
+        text = node.text_content or ""
+        parent = node.parent
+        if parent is not None and parent.tag in UNESCAPED_TEXT_ELEMENTS:
+            parts.append(text)
+        else:
+            parts.append(formatting.entities.substitute_xml(text))
+        return
+    if tag == "-comment":
+        # comment_content strips the whitespace that BeautifulSoup keeps
+        parts.append(node.html)
+        return
+    
+    attributes = []
+    multi_valued = formatting.multi_valued_attributes.get("*", set()) | formatting.multi_valued_attributes.get(tag, set())
+    for name, value in sorted((name, "" if value is None else value) for name, value in node.attributes.items()):
+        if name in multi_valued:
+            value = " ".join(value.split())
+        value = formatting.entities.quoted_attribute_value(formatting.entities.substitute_xml(value))
+        attributes.append(f" {name}={value}")
+    attribute_text = "".join(attributes)
+    
+    if tag in formatting.void_elements:
+        parts.append(f"<{tag}{attribute_text}/>")
+        return
+    
+    parts.append(f"<{tag}{attribute_text}>")
+    child = node.child
+    while child is not None:
+        serialize_node(child, parts, formatting)
+        child = child.next
+    parts.append(f"</{tag}>")
+
+
+class MarkupNormalizer(HTMLParser):
+    """
+    Reduces HTML to the tokens that the backends must agree on.
+    
+    Tag and attribute names are lowercased, attributes are sorted, entities
+    are decoded and whitespace is collapsed. End tags and <tbody> are left
+    out, since where the parsers close elements and whether they add the
+    implied <tbody> does not change what the markup shows.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.tokens = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag != "tbody":
+            self.tokens.append((tag, tuple(sorted((name, " ".join((value or "").split())) for name, value in attrs))))
+    
+    def handle_data(self, data):
+        text = " ".join(data.split())
+        if not text:
+            return
+        if self.tokens and isinstance(self.tokens[-1], str):
+            # Text split by a left out end tag
+            self.tokens[-1] = f"{self.tokens[-1]} {text}"
+        else:
+            self.tokens.append(text)
+    
+    def handle_comment(self, data):
+        self.tokens.append(("!--", " ".join(data.split())))
+
+
+def normalize_markup(html):
+    """Returns the tokens of HTML that MarkupNormalizer keeps"""
+    normalizer = MarkupNormalizer()
+    normalizer.feed(html)
+    normalizer.close()
+    return normalizer.tokens
+
+
+def group_summaries(backend, content):
+    """Returns the MessageInfo, with author, and the normalized markup of each message group a backend finds in HTML text"""
+    return [
+        (backend.classify(group, with_author=True), normalize_markup(backend.serialize(group)))
+        for group in backend.parse(content)
+    ]
+
+
+# Fastest first
+BACKENDS = {
+    "selectolax": LexborBackend(),
+    "lxml": SoupBackend("lxml", "lxml", "lxml"),
+    "html.parser": SoupBackend("html.parser", "html.parser"),
+}
+# The backend whose message groups the other backends are compared with
+REFERENCE_BACKEND = "html.parser"
+
+# Message groups with the markup the parsers are known to build differently
+CONFORMANCE_SAMPLE = """
+<div class="chatlog__message-group">
+<span class="chatlog__author-name" title="user1#0001">User 1</span>
+<span class="chatlog__timestamp" title="Tuesday, March 12, 2019 10:00 AM">03/12/2019 10:00 AM</span>
+<div class="chatlog__message" title="Message sent: Tuesday, March 12, 2019 10:00 AM">
+<div class="chatlog__content">edited <!-- message edited -->text<!--no spaces--> &amp; &lt;escaped&gt;</div>
+<div class="chatlog__content"><svg class="emoji" viewBox="0 0 36 36"><path d="M18 0a18 18 0 1 0 0 36"/></svg> svg<br></div>
+</div>
+</div>
+<div class="chatlog__message-group">
+<span class="chatlog__author-name">User 2</span>
+<span class="chatlog__timestamp">05-Jan-17 10:00 AM</span>
+<div class="chatlog__message" title="Message sent: 05-Jan-17 10:00 AM">
+<div class="chatlog__content"><table><tr><th>name</th><td>value</td></tr></table></div>
+<div class="chatlog__content"><p>first paragraph<p>second paragraph</div>
+</div>
+</div>
+"""
+
+
+def available_backends():
+    """Returns the names of the installed backends, fastest first"""
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def resolve_backend(backend="auto"):
+    """
+    Resolves a backend name to its backend.
+    
+    Args:
+        backend: Backend name ("selectolax", "lxml", "html.parser"), "auto" for
+            auto_backend(), or a backend object
+    
+    Returns:
+        Backend with parse(), classify() and serialize() methods
+    
+    Raises:
+        ValueError: If the backend is not recognized or not installed
+    """
+    if not isinstance(backend, str):
+        return backend
+    if backend == "auto":
+        return BACKENDS[auto_backend()]
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    if not BACKENDS[backend].available():
+        raise ValueError(f"Parser backend {backend} is not installed")
+    return BACKENDS[backend]
+
+
+def conformance_differences(backend, content, reference=REFERENCE_BACKEND):
+    """
+    Compares the message groups that two backends find in HTML text.
+    
+    Args:
+        backend: Backend name or object to check
+        content: HTML text of an export or a part of one
+        reference: Backend name or object to compare with
+    
+    Returns:
+        Positions of the message groups whose MessageInfo or normalized markup
+        differ, including the groups only one of the backends found
+    """
+    expected = group_summaries(resolve_backend(reference), content)
+    actual = group_summaries(resolve_backend(backend), content)
+    return [
+        index for index in range(max(len(expected), len(actual)))
+        if index >= len(expected) or index >= len(actual) or expected[index] != actual[index]
+    ]
+
+
+@functools.lru_cache(maxsize=None)
+def auto_backend():
+    """Returns the name of the fastest installed backend that builds CONFORMANCE_SAMPLE like REFERENCE_BACKEND"""
+    for name in available_backends():
+        if name == REFERENCE_BACKEND or not conformance_differences(name, CONFORMANCE_SAMPLE):
+            return name
+    return REFERENCE_BACKEND
@@ -0,0 +1,146 @@
+"""
+Batch mode: parses many Discord exports in one run on a shared worker pool.
+"""
+
+import glob
+import os
+import re
+
+from dsparser import parser
+from dsparser.partition import resolve_partition, channel_dir_name
+from dsparser.utils.compression import detect_compression
+
+
+PART_SUFFIX = re.compile(r'\s*\[part (\d+)\]$', re.IGNORECASE)
+HTML_EXTENSIONS = (".html", ".htm")
+
+
+def find_input_files(inputs):
+    """
+    Expands input paths into a list of HTML files.
+    
+    Args:
+        inputs: File paths, directories (searched recursively) and glob patterns
+    
+    Returns:
+        Sorted list of unique file paths
+    """
+    files = set()
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.update(os.path.join(root, name) for name in names if name.lower().endswith(HTML_EXTENSIONS))
+        elif any(char in path for char in "*?["):
+            files.update(match for match in glob.glob(path, recursive=True) if os.path.isfile(match))
+        else:
+            files.add(path)
+    return sorted(files)
+
+
+def channel_name(input_file):
+    """
+    Returns the channel of an export from its file name.
+    
+    Exports split into several files ("... [part 2].html") belong to the same channel.
+    """
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    return PART_SUFFIX.sub("", stem)
+
+
+def channel_names(files):
+    """
+    Returns the channel of every export, by file path.
+    
+    Exports with the same channel_name() in different folders are different
+    channels. Their channel is prefixed with their folder relative to the
+    folder all input files are in, so each gets its own subfolder and header,
+    and a warning names the subfolders.
+    """
+    folders = {path: os.path.dirname(os.path.abspath(path)) for path in files}
+    channels = {path: channel_name(path) for path in files}
+    
+    folders_by_channel = {}
+    for path, channel in channels.items():
+        folders_by_channel.setdefault(channel, set()).add(folders[path])
+    colliding = {channel for channel, channel_folders in folders_by_channel.items() if len(channel_folders) > 1}
+    if not colliding:
+        return channels
+    
+    root = os.path.commonpath(list(folders.values()))
+    for path, channel in channels.items():
+        folder = os.path.relpath(folders[path], root)
+        if channel in colliding and folder != os.curdir:
+            channels[path] = "/".join(folder.split(os.sep) + [channel])
+    
+    for channel in sorted(colliding):
+        subfolders = sorted({channel_dir_name(channels[path]) for path in files if channel_name(path) == channel})
+        print(f"Warning: exports named '{channel}' are in several folders and are written to {', '.join(subfolders)}")
+    return channels
+
+
+def part_number(input_file):
+    """Returns the part number of a split export ("... [part 2].html"), or 0 for a file that is not a part"""
+    match = PART_SUFFIX.search(os.path.splitext(os.path.basename(input_file))[0])
+    return int(match.group(1)) if match else 0
+
+
+def parse_discord_html_batch(inputs, output_dir, workers=4, chunk_size_mb=10, mode="threads", engine="soup",
+                             queue_size=parser.DEFAULT_QUEUE_SIZE, memory_budget_mb=None,
+                             write_buffer_mb=parser.DEFAULT_WRITE_BUFFER_MB, fsync="none", ordered=False,
+                             partition="year", max_open_files=parser.DEFAULT_MAX_OPEN_FILES, compress=None,
+                             index=False, backend="auto", shared_assets=False, shared_media=False):
+    """
+    Parses many exports with one worker pool, writing each channel to its own subfolder.
+    
+    Byte ranges of all files are scheduled on the same pool, largest files
+    first so a big export does not finish last on its own. With ordered
+    output the files of each channel are taken in part number order instead, so
+    the parts of a split export follow each other.
+    """
+    files = find_input_files(inputs)
+    if not files:
+        print("No input files found.")
+        return
+    
+    if index and compress:
+        raise ValueError("The message index does not support compressed output")
+    
+    compressed = [path for path in files if detect_compression(path) is not None]
+    if compressed:
+        # Batch chunks are byte ranges of the input files, which compressed files do not have
+        raise ValueError(f"Batch mode does not support compressed input files: {compressed[0]}")
+    
+    channels = channel_names(files)
+    if ordered:
+        # Numerically, so "[part 10]" follows "[part 9]"
+        files.sort(key=lambda path: (channels[path], part_number(path), path))
+    else:
+        files.sort(key=os.path.getsize, reverse=True)
+    
+    os.makedirs(output_dir, exist_ok=True)
+    parser.extract_html_parts(files[0])
+    
+    queue_bytes_limit = None
+    if memory_budget_mb:
+        chunk_size_mb, queue_bytes_limit = parser.split_memory_budget(memory_budget_mb, workers, chunk_size_mb)
+    chunk_size = chunk_size_mb * 1024 * 1024
+    
+    parser.start_output(output_dir, queue_size, queue_bytes_limit, write_buffer_mb, fsync,
+                        resolve_partition(partition), max_open_files, compress, index, backend, shared_assets,
+                        shared_media)
+    
+    try:
+        tasks = []
+        total_size = 0
+        for input_file in files:
+            channel = channels[input_file]
+            if channel not in parser.channel_headers:
+                parser.channel_headers[channel] = parser.read_html_parts(input_file)[0]
+            
+            tasks.extend((input_file, start, end, channel) for start, end in parser.split_byte_ranges(input_file, chunk_size))
+            total_size += os.path.getsize(input_file)
+        
+        print(f"Processing {len(files)} files in {len(tasks)} chunks")
+        parser.run_range_tasks(tasks, total_size, workers, mode, engine, ordered)
+    finally:
+        parser.finish_output()
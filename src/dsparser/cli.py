@@ -1,9 +1,19 @@
 """
 Command-line interface for DSParser
+
+The parser and the modules of each mode are imported when a run needs
+them, so --help and argument errors do not wait for them.
 """
 
 import argparse
-from dsparser.parser import parse_discord_html
+import os
+from dsparser.backends import BACKENDS
+
+
+# dsparser.merge.DEFAULT_WINDOW_HOURS, repeated so the help does not import the merge mode
+DEFAULT_WINDOW_HOURS = 24
+# dsparser.parser.WRITER_THREADS, repeated for the same reason
+WRITER_THREADS = 4
 
 
 def create_parser():
@@ -14,11 +24,12 @@ def create_parser():
         ArgumentParser: Configured argument parser
     """
     parser = argparse.ArgumentParser(
-        description="Parallel parsing of Discord HTML message file and splitting by years."
+        description="Parallel parsing of Discord HTML message file and splitting by years or other partitions."
     )
     parser.add_argument(
-        "--input", "-i", required=True,
-        help="Path to input HTML file."
+        "--input", "-i", required=True, nargs="+",
+        help="Path to input HTML file. Several files, folders (searched recursively) or glob "
+             "patterns run in batch mode, writing each channel to its own subfolder."
     )
     parser.add_argument(
         "--output", "-o", default="output",
@@ -32,21 +43,225 @@ def create_parser():
         "--workers", "-w", type=int, default=4,
         help="Number of worker threads for parallel processing (default: 4)."
     )
+    parser.add_argument(
+        "--mode", "-m", choices=["threads", "processes"], default="threads",
+        help="Execution mode: 'threads' or 'processes', where each worker process "
+             "parses its own byte range of the file (default: threads)."
+    )
+    parser.add_argument(
+        "--engine", "-e", choices=["soup", "scan"], default=None,
+        help="Parsing engine: 'soup' builds a BeautifulSoup tree, 'scan' finds message "
+             "groups in raw bytes and copies them unchanged (default: soup, or the faster "
+             "one with --auto)."
+    )
+    parser.add_argument(
+        "--auto", action="store_true",
+        help="Parse a sample of the input first and pick the number of workers, the chunk size "
+             "and, unless --engine is given, the engine from the measured speed and memory and "
+             "the CPUs and memory available. Replaces --workers and --chunk-size."
+    )
+    parser.add_argument(
+        "--backend", "-b", choices=["auto"] + list(BACKENDS), default="auto",
+        help="HTML parser of the soup engine: 'selectolax' (lexbor, needs the selectolax package), "
+             "'lxml' (needs lxml) or 'html.parser'. 'auto' uses the fastest installed one that finds "
+             "the same message groups, partition keys and normalized markup as html.parser on a sample "
+             "of known parser differences (default: auto)."
+    )
+    parser.add_argument(
+        "--queue-size", "-q", type=int, default=8,
+        help="Maximum number of message batches waiting in the queue of each of the 4 writer "
+             "threads before parsing blocks. A batch holds the message groups of one chunk for "
+             "one output file, so at most 4 x this many chunks are queued (default: 8)."
+    )
+    parser.add_argument(
+        "--memory-budget", type=int, default=None,
+        help="Approximate memory budget in MB. Limits the chunk size and the total "
+             "size of queued message groups (default: no limit)."
+    )
+    parser.add_argument(
+        "--write-buffer", type=float, default=1,
+        help="Size of the write buffer of each output file in MB (default: 1)."
+    )
+    parser.add_argument(
+        "--fsync", choices=["none", "close", "batch"], default="none",
+        help="When to fsync output files: never, once when a file is closed, "
+             "or after every written batch (default: none)."
+    )
+    parser.add_argument(
+        "--ordered", action="store_true",
+        help="Write message groups to each output file in the order they appear in the input."
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Keep a checkpoint manifest in the output folder and continue from it: input "
+             "unchanged since the last run is skipped and only new message groups are "
+             "appended. Implies --ordered."
+    )
+    parser.add_argument(
+        "--partition-by", "-p", default="year",
+        help="How to split messages into output files: 'year', 'month', 'week' (ISO week), "
+             "'author', or a 'module:function' key function taking a MessageInfo (default: year)."
+    )
+    parser.add_argument(
+        "--max-open-files", type=int, default=256,
+        help="Maximum number of output files kept open at once, at least 4, one per writer thread; "
+             "the least recently used file is closed and reopened for append when needed (default: 256)."
+    )
+    parser.add_argument(
+        "--compress", choices=["none", "gzip", "zstd"], default="none",
+        help="Compress output files with gzip (.html.gz) or zstd (.html.zst); zstd needs the "
+             "zstandard package. Compressed inputs are detected and decompressed automatically "
+             "(default: none)."
+    )
+    parser.add_argument(
+        "--index", action="store_true",
+        help="Also write a columnar message index (.dsparser-index) with the time, author, "
+             "file and byte offset of every message group, for queries with dsparser.index.MessageIndex."
+    )
+    parser.add_argument(
+        "--shared-assets", action="store_true",
+        help="Store the stylesheets and embedded images of the export header once in an 'assets' "
+             "folder of the output, linked from every output file, instead of copying them into each file."
+    )
+    parser.add_argument(
+        "--shared-media", action="store_true",
+        help="Store the large embedded images and attachments (base64 data: URIs) of message groups "
+             "once in the 'assets' folder of the output and link them, instead of repeating them."
+    )
+    parser.add_argument(
+        "--merge", action="store_true",
+        help="Merge several exports of the same channel into one set of files, in chronological "
+             "order and with every message group written once, identified by its message ids."
+    )
+    parser.add_argument(
+        "--merge-window", type=float, default=DEFAULT_WINDOW_HOURS,
+        help="Hours within which copies of a message are recognized in --merge mode; exports "
+             f"out of order by more than this can leave duplicates (default: {DEFAULT_WINDOW_HOURS})."
+    )
+    parser.add_argument(
+        "--stats", default=None, metavar="STATS_OUT",
+        help="Only count message groups, messages and bytes by year, month and author and write them "
+             "to this file, as CSV if it ends with .csv and as JSON otherwise. No HTML files are written."
+    )
+    parser.add_argument(
+        "--metrics-out", default=None,
+        help="Write run metrics (stage timings, queue depths, lock and backpressure waits) to this "
+             "file, in the Prometheus text format if it ends with .prom and as JSON otherwise."
+    )
+    parser.add_argument(
+        "--profile", default=None,
+        help="Profile the run with cProfile and save the statistics to this file, for pstats or snakeviz."
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="Trace allocations with tracemalloc and add the peak and the largest allocation "
+             "sites to the metrics (slows parsing down considerably)."
+    )
     return parser
 
 
-def main():
+def main(argv=None):
     """
     Main CLI function for DSParser.
     
     This function is the single entry point for all command calls.
     It is also imported and used in other modules to run the
     script directly, for example from __main__.py or parser.py.
+    
+    Args:
+        argv: Command-line arguments, sys.argv[1:] if None
     """
     parser = create_parser()
-    args = parser.parse_args()
+    execute(parser, parser.parse_args(argv))
+
+
+def execute(parser, args):
+    """
+    Checks the parsed arguments and runs them, collecting metrics if requested.
+    
+    Args:
+        parser: ArgumentParser that parsed the arguments, for reporting errors
+        args: Parsed command-line arguments
+    """
+    compress = None if args.compress == "none" else args.compress
+    if args.resume and compress:
+        parser.error("--resume is not supported with --compress")
+    if args.index and (args.resume or compress):
+        parser.error("--index is not supported with --resume or --compress")
+    
+    if args.resume and (args.merge or not (len(args.input) == 1 and os.path.isfile(args.input[0]))):
+        parser.error("--resume is not supported with several input files or --merge")
+    if args.auto and args.merge:
+        parser.error("--auto is not supported with --merge")
+    if args.stats and (args.merge or args.resume or args.index):
+        parser.error("--stats is not supported with --merge, --resume or --index")
+    if args.max_open_files < WRITER_THREADS:
+        parser.error(f"--max-open-files must be at least {WRITER_THREADS}, one file per writer thread")
+    
+    from dsparser.metrics import collect_metrics
+    with collect_metrics(args.metrics_out, args.profile, args.trace_memory):
+        run(args, compress)
+
+
+def run(args, compress):
+    """
+    Parses the input of the parsed arguments, in batch mode for several files,
+    in merge mode with --merge or only counting messages with --stats.
+    
+    Args:
+        args: Parsed command-line arguments
+        compress: Output compression, or None
+    """
+    if args.auto:
+        from dsparser.batch import find_input_files
+        from dsparser.tuning import calibrate
+        files = find_input_files(args.input)
+        if files:
+            # Tuned for the largest file, which takes longest in batch mode
+            calibration = calibrate(max(files, key=os.path.getsize), args.mode, args.engine, args.backend,
+                                    args.memory_budget)
+            args.workers, args.chunk_size = calibration.workers, calibration.chunk_size_mb
+            args.engine = calibration.engine
+    if args.engine is None:
+        args.engine = "soup"
     
-    parse_discord_html(args.input, args.output, args.workers, args.chunk_size)
+    if args.stats:
+        from dsparser.stats import parse_discord_html_stats
+        parse_discord_html_stats(args.input, args.stats, args.workers, args.chunk_size, args.mode, args.backend)
+        return
+    
+    if args.merge:
+        from dsparser.merge import parse_discord_html_merge
+        parse_discord_html_merge(
+            args.input, args.output, partition=args.partition_by, window_hours=args.merge_window,
+            queue_size=args.queue_size, memory_budget_mb=args.memory_budget,
+            write_buffer_mb=args.write_buffer, fsync=args.fsync, max_open_files=args.max_open_files,
+            compress=compress, index=args.index, shared_assets=args.shared_assets,
+            shared_media=args.shared_media
+        )
+        return
+    
+    if len(args.input) == 1 and os.path.isfile(args.input[0]):
+        from dsparser.parser import parse_discord_html
+        parse_discord_html(
+            args.input[0], args.output, args.workers, args.chunk_size, args.mode, args.engine,
+            queue_size=args.queue_size, memory_budget_mb=args.memory_budget,
+            write_buffer_mb=args.write_buffer, fsync=args.fsync, ordered=args.ordered,
+            resume=args.resume, partition=args.partition_by, max_open_files=args.max_open_files,
+            compress=compress, index=args.index, backend=args.backend,
+            shared_assets=args.shared_assets, shared_media=args.shared_media
+        )
+        return
+    
+    from dsparser.batch import parse_discord_html_batch
+    parse_discord_html_batch(
+        args.input, args.output, args.workers, args.chunk_size, args.mode, args.engine,
+        queue_size=args.queue_size, memory_budget_mb=args.memory_budget,
+        write_buffer_mb=args.write_buffer, fsync=args.fsync, ordered=args.ordered,
+        partition=args.partition_by, max_open_files=args.max_open_files, compress=compress,
+        index=args.index, backend=args.backend, shared_assets=args.shared_assets,
+        shared_media=args.shared_media
+    )
 
 
 if __name__ == "__main__":
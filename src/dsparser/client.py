@@ -0,0 +1,97 @@
+"""
+Thin client of the dsparser daemon.
+
+Submits the command-line arguments of a run to the daemon over its Unix
+socket and prints the output of the run. Only the standard library is
+imported, so the client starts as fast as the interpreter does. Without a
+running daemon the run happens in the client's own process.
+"""
+
+import json
+import os
+import socket
+import sys
+
+
+SOCKET_ENVIRONMENT_VARIABLE = "DSPARSER_SOCKET"
+
+
+def default_socket_path():
+    """Returns the socket path from DSPARSER_SOCKET, or ~/.dsparser.sock"""
+    return os.environ.get(SOCKET_ENVIRONMENT_VARIABLE) or os.path.join(os.path.expanduser("~"), ".dsparser.sock")
+
+
+def connect(socket_path=None):
+    """
+    Connects to the daemon.
+    
+    Args:
+        socket_path: Socket of the daemon, default_socket_path() if None
+    
+    Returns:
+        Socket connected to the daemon
+    
+    Raises:
+        OSError: If no daemon is listening on the socket
+        AttributeError: If the platform has no Unix sockets
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socket_path or default_socket_path())
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+
+def submit(argv, connection):
+    """
+    Runs dsparser with command-line arguments in the daemon.
+    
+    Relative paths in the arguments are resolved against the current
+    folder of the client. The run is not repeated if the connection fails
+    after it was submitted, since the daemon may have written output already.
+    
+    Args:
+        argv: Command-line arguments of dsparser
+        connection: Socket connected to the daemon, see connect(). It is closed afterwards
+    
+    Returns:
+        Exit status of the run, 1 if the connection to the daemon failed during the run
+    """
+    with connection:
+        try:
+            with connection.makefile('wb') as requests:
+                requests.write(json.dumps({"argv": list(argv), "cwd": os.getcwd()}).encode('utf-8') + b"\n")
+            
+            with connection.makefile('rb') as replies:
+                for line in replies:
+                    reply = json.loads(line)
+                    if "exit" in reply:
+                        return reply["exit"]
+                    stream = sys.stderr if reply["stream"] == "stderr" else sys.stdout
+                    stream.write(reply["text"])
+                    stream.flush()
+        except OSError as e:
+            print(f"Lost the connection to the dsparser daemon during the run: {e}", file=sys.stderr)
+            return 1
+    
+    print("The dsparser daemon closed the connection before the run finished", file=sys.stderr)
+    return 1
+
+
+def main(argv=None):
+    """Submits a run to the daemon, or runs it in this process if no daemon is running"""
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        connection = connect()
+    except (OSError, AttributeError):
+        # No daemon, or no Unix sockets on this platform
+        from dsparser.cli import main as run_locally
+        run_locally(argv)
+        return
+    sys.exit(submit(argv, connection))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Daemon mode: a long-lived process that runs the exports submitted to it
+over a local Unix socket, keeping its worker pools, imports, compiled
+patterns and caches warm between runs.
+
+A client sends one JSON line {"argv": [...], "cwd": "..."} with the
+command-line arguments of dsparser and its current folder. The daemon
+answers with JSON lines {"stream": "stdout" or "stderr", "text": ...}
+carrying the output of the run, and a last line {"exit": status}. Runs
+are executed one at a time, since a run owns the output state of
+dsparser.parser.
+"""
+
+import argparse
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+from dsparser import parser
+from dsparser.backends import resolve_backend
+from dsparser.cli import create_parser, execute
+from dsparser.client import default_socket_path
+
+
+class ReplyStream(io.TextIOBase):
+    """Text stream that sends what is written to it to the client as JSON lines"""
+    
+    def __init__(self, replies, name, lock):
+        self.replies = replies
+        self.name = name
+        self.lock = lock
+    
+    def writable(self):
+        return True
+    
+    def write(self, text):
+        if text:
+            with self.lock:
+                try:
+                    self.replies.write(json.dumps({"stream": self.name, "text": text}).encode('utf-8') + b"\n")
+                    self.replies.flush()
+                except OSError:
+                    # The client went away; the run still finishes
+                    pass
+        return len(text)
+
+
+class RunHandler(socketserver.StreamRequestHandler):
+    """Runs the job of one client connection"""
+    
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+            argv, cwd = list(request["argv"]), request["cwd"]
+        except (ValueError, KeyError, TypeError):
+            return
+        
+        lock = threading.Lock()
+        stdout = ReplyStream(self.wfile, "stdout", lock)
+        stderr = ReplyStream(self.wfile, "stderr", lock)
+        status = self.server.run(argv, cwd, stdout, stderr)
+        
+        try:
+            self.wfile.write(json.dumps({"exit": status}).encode('utf-8') + b"\n")
+        except OSError:
+            pass
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server that runs one submitted job at a time"""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path):
+        super().__init__(socket_path, RunHandler)
+        self.run_lock = threading.Lock()
+    
+    def run(self, argv, cwd, stdout, stderr):
+        """
+        Runs dsparser with command-line arguments, writing its output to the given streams.
+        
+        Args:
+            argv: Command-line arguments of dsparser
+            cwd: Folder that relative paths in the arguments are relative to
+            stdout: Stream for the standard output of the run
+            stderr: Stream for the error output of the run
+        
+        Returns:
+            Exit status of the run
+        """
+        with self.run_lock, redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                cli_parser = create_parser()
+                cli_parser.prog = "dsparser"
+                args = cli_parser.parse_args(argv)
+                # Worker processes do not share a current folder with the client
+                args.input = [os.path.join(cwd, path) for path in args.input]
+                args.output = os.path.join(cwd, args.output)
+                if args.metrics_out:
+                    args.metrics_out = os.path.join(cwd, args.metrics_out)
+                if args.profile:
+                    args.profile = os.path.join(cwd, args.profile)
+                if args.stats:
+                    args.stats = os.path.join(cwd, args.stats)
+                execute(cli_parser, args)
+                return 0
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    return e.code or 0
+                print(e.code, file=stderr)
+                return 1
+            except Exception:
+                traceback.print_exc(file=stderr)
+                return 1
+
+
+def warm_up(workers, mode):
+    """Loads the parser backend and tqdm and starts the worker pool that runs with default settings use"""
+    # The progress bars of runs import tqdm, so the first run does not pay for it
+    importlib.import_module("tqdm")
+    resolve_backend("auto").parse('<div class="chatlog__message-group"></div>')
+    parser.keep_worker_pools()
+    with parser.worker_pool(workers, mode) as pool:
+        # Process pools start their processes on first use
+        for future in [pool.submit(os.getpid) for _ in range(workers)]:
+            future.result()
+
+
+def remove_stale_socket(socket_path):
+    """
+    Removes the socket file of a daemon that is no longer running.
+    
+    Raises:
+        RuntimeError: If a daemon is still listening on the socket
+    """
+    if not os.path.exists(socket_path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"A dsparser daemon is already listening on {socket_path}")
+
+
+def serve(socket_path=None, workers=4, mode="threads"):
+    """
+    Runs the daemon until it is interrupted or terminated.
+    
+    Args:
+        socket_path: Socket to listen on, see dsparser.client.default_socket_path()
+        workers: Workers of the pool started up front
+        mode: Execution mode of the pool started up front, "threads" or "processes"
+    """
+    socket_path = socket_path or default_socket_path()
+    remove_stale_socket(socket_path)
+    warm_up(workers, mode)
+    
+    # Only the user running the daemon may submit runs
+    umask = os.umask(0o077)
+    try:
+        server = DaemonServer(socket_path)
+    finally:
+        os.umask(umask)
+    
+    def stop(*_):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    
+    signal.signal(signal.SIGTERM, stop)
+    print(f"dsparser daemon listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        parser.shutdown_worker_pools()
+
+
+def main(argv=None):
+    """Command-line entry point of the daemon"""
+    argument_parser = argparse.ArgumentParser(
+        description="Keep dsparser loaded and run the exports submitted with dsparser-client."
+    )
+    argument_parser.add_argument(
+        "--socket", default=None,
+        help="Unix socket to listen on (default: $DSPARSER_SOCKET or ~/.dsparser.sock)."
+    )
+    argument_parser.add_argument(
+        "--workers", "-w", type=int, default=4,
+        help="Workers of the pool started up front; runs with other settings start and keep "
+             "their own pool (default: 4)."
+    )
+    argument_parser.add_argument(
+        "--mode", "-m", choices=["threads", "processes"], default="threads",
+        help="Execution mode of the pool started up front (default: threads)."
+    )
+    args = argument_parser.parse_args(argv)
+    try:
+        serve(args.socket, args.workers, args.mode)
+    except RuntimeError as e:
+        argument_parser.exit(1, f"{e}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+Columnar message index written alongside the partition files.
+
+The index has one row per message group and stores each column in its own
+file of fixed-width native integers, so columns can be memory-mapped and
+scanned without reading any HTML:
+    
+    timestamp  int64  seconds since 1970-01-01 of the message time as shown
+                      in the export (no time zone), or MISSING_TIMESTAMP
+    author     int32  position in the author list, or -1 if the author is unknown
+    file       int32  position in the file list, paths relative to the output folder
+    offset     int64  byte offset of the message group in its file
+    length     int64  byte length of the message group
+
+The author and file lists are saved in index.json. Rows are in the order
+the writers wrote them, which is input order within each file when the
+run is ordered.
+"""
+
+import datetime
+import json
+import mmap
+import os
+import re
+import threading
+from array import array
+from typing import Iterator, List, Optional
+
+from dsparser.partition import parse_message_info
+from dsparser.utils.html_helpers import parse_message_timestamp
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+INDEX_DIR = ".dsparser-index"
+INDEX_VERSION = 1
+
+COLUMNS = {
+    "timestamp": "q",
+    "author": "i",
+    "file": "i",
+    "offset": "q",
+    "length": "q",
+}
+
+MISSING_TIMESTAMP = -2 ** 63
+
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([AaPp][Mm])?')
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def timestamp_seconds(info, timestamp_text) -> int:
+    """
+    Converts the date and time of a message group to seconds since 1970-01-01.
+    
+    Args:
+        info: MessageInfo of the group, or None
+        timestamp_text: Timestamp string of the group, or None
+    
+    Returns:
+        Seconds as shown in the export, or MISSING_TIMESTAMP if the date is incomplete
+    """
+    if info is None or info.month is None or info.day is None:
+        return MISSING_TIMESTAMP
+    
+    hour = minute = second = 0
+    time_match = TIME_PATTERN.search(timestamp_text or "")
+    if time_match:
+        hour, minute = int(time_match.group(1)), int(time_match.group(2))
+        second = int(time_match.group(3) or 0)
+        meridiem = (time_match.group(4) or "").lower()
+        if meridiem == "pm" and hour < 12:
+            hour += 12
+        elif meridiem == "am" and hour == 12:
+            hour = 0
+    
+    try:
+        moment = datetime.datetime(int(info.year), info.month, info.day, hour, minute, second)
+    except ValueError:
+        return MISSING_TIMESTAMP
+    return (moment - EPOCH) // datetime.timedelta(seconds=1)
+
+
+def index_row(info, timestamp_text):
+    """
+    Returns the values of a message group's index row that do not depend on where it is written.
+    
+    Parse workers call this while classifying the groups, so the writers
+    do not have to classify them again.
+    
+    Args:
+        info: MessageInfo of the group including its author, or None
+        timestamp_text: Timestamp string of the group, or None
+    
+    Returns:
+        Tuple (timestamp, author) with the seconds of timestamp_seconds() and the author, or None
+    """
+    return timestamp_seconds(info, timestamp_text), info.author if info is not None else None
+
+
+def group_index_row(group_html):
+    """Returns the index_row() of a message group from its HTML"""
+    return index_row(parse_message_info(group_html, with_author=True), parse_message_timestamp(group_html))
+
+
+class IndexWriter:
+    """
+    Appends index rows from several writer threads.
+    
+    Rows of one batch are appended under a lock, so the columns always
+    stay the same length.
+    """
+    
+    def __init__(self, output_dir: str):
+        self.index_dir = os.path.join(output_dir, INDEX_DIR)
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.authors = {}
+        self.files = {}
+        self.rows = 0
+        self.column_files = {
+            name: open(os.path.join(self.index_dir, name + ".bin"), "wb")
+            for name in COLUMNS
+        }
+    
+    def add_batch(self, file_name: str, offset: int, groups: List[bytes], rows: Optional[List[tuple]] = None) -> None:
+        """
+        Indexes a batch of message groups written contiguously to a file.
+        
+        Args:
+            file_name: Path of the partition file relative to the output folder
+            offset: Offset in the file where the first group was written
+            groups: Message groups in the order they were written
+            rows: index_row() of each group, as computed by the parse workers.
+                The groups are classified again if None
+        """
+        if rows is None:
+            rows = [group_index_row(group.decode('utf-8', errors='replace')) for group in groups]
+        
+        timestamps = array("q", [timestamp for timestamp, _ in rows])
+        authors = [author for _, author in rows]
+        offsets = array("q")
+        lengths = array("q")
+        for group in groups:
+            offsets.append(offset)
+            lengths.append(len(group))
+            offset += len(group)
+        
+        with self.lock:
+            file_id = self.files.setdefault(file_name, len(self.files))
+            author_ids = array("i", (
+                -1 if author is None else self.authors.setdefault(author, len(self.authors))
+                for author in authors
+            ))
+            timestamps.tofile(self.column_files["timestamp"])
+            author_ids.tofile(self.column_files["author"])
+            array("i", [file_id] * len(groups)).tofile(self.column_files["file"])
+            offsets.tofile(self.column_files["offset"])
+            lengths.tofile(self.column_files["length"])
+            self.rows += len(groups)
+    
+    def close(self) -> None:
+        """Closes the column files and writes the author and file dictionaries"""
+        for file in self.column_files.values():
+            file.close()
+        
+        meta = {
+            "version": INDEX_VERSION,
+            "rows": self.rows,
+            "columns": COLUMNS,
+            "authors": sorted(self.authors, key=self.authors.get),
+            "files": sorted(self.files, key=self.files.get),
+        }
+        with open(os.path.join(self.index_dir, "index.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+
+
+class MessageIndex:
+    """
+    Read access to the message index of an output folder.
+    
+    Columns are memory-mapped. They are numpy arrays when numpy is
+    installed, so filters and aggregates can be vectorized, and
+    memoryviews of native integers otherwise.
+    """
+    
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.index_dir = os.path.join(output_dir, INDEX_DIR)
+        
+        with open(os.path.join(self.index_dir, "index.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version: {meta.get('version')}")
+        
+        self.rows = meta["rows"]
+        self.authors = meta["authors"]
+        self.files = meta["files"]
+        self.author_ids = {author: author_id for author_id, author in enumerate(self.authors)}
+        self.maps = []
+        self.columns = {name: self.map_column(name, type_code) for name, type_code in COLUMNS.items()}
+    
+    def map_column(self, name, type_code):
+        path = os.path.join(self.index_dir, name + ".bin")
+        if self.rows == 0:
+            return numpy.array([], dtype=type_code) if numpy is not None else memoryview(array(type_code))
+        
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.maps.append(mapped)
+        if numpy is not None:
+            return numpy.frombuffer(mapped, dtype=type_code, count=self.rows)
+        return memoryview(mapped).cast(type_code)[:self.rows]
+    
+    def close(self) -> None:
+        """Releases the memory-mapped columns"""
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {}
+        for mapped in self.maps:
+            try:
+                mapped.close()
+            except BufferError:
+                # A numpy array still refers to the mapping; it closes when collected
+                pass
+        self.maps = []
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def find(self, author: Optional[str] = None, start: Optional[datetime.datetime] = None,
+             end: Optional[datetime.datetime] = None) -> List[int]:
+        """
+        Finds the rows of message groups matching all given conditions.
+        
+        Args:
+            author: Author name as written in the export
+            start: Earliest message time, inclusive
+            end: Latest message time, exclusive
+        
+        Returns:
+            Row numbers in index order
+        """
+        author_id = None
+        if author is not None:
+            author_id = self.author_ids.get(author)
+            if author_id is None:
+                return []
+        start_seconds = None if start is None else (start - EPOCH) // datetime.timedelta(seconds=1)
+        end_seconds = None if end is None else (end - EPOCH) // datetime.timedelta(seconds=1)
+        
+        timestamps = self.columns["timestamp"]
+        authors = self.columns["author"]
+        
+        if numpy is not None:
+            mask = numpy.ones(self.rows, dtype=bool)
+            if author_id is not None:
+                mask &= authors == author_id
+            if start_seconds is not None:
+                mask &= timestamps >= start_seconds
+            if end_seconds is not None:
+                mask &= (timestamps < end_seconds) & (timestamps != MISSING_TIMESTAMP)
+            return numpy.flatnonzero(mask).tolist()
+        
+        return [
+            row for row in range(self.rows)
+            if (author_id is None or authors[row] == author_id)
+            and (start_seconds is None or timestamps[row] >= start_seconds)
+            and (end_seconds is None or MISSING_TIMESTAMP != timestamps[row] < end_seconds)
+        ]
+    
+    def counts_per_day(self) -> dict:
+        """
+        Counts message groups per day.
+        
+        Returns:
+            Dictionary of datetime.date to count, in date order. Groups
+            without a date are not counted.
+        """
+        timestamps = self.columns["timestamp"]
+        if numpy is not None:
+            days, counts = numpy.unique(timestamps[timestamps != MISSING_TIMESTAMP] // 86400, return_counts=True)
+            pairs = zip(days.tolist(), counts.tolist())
+        else:
+            day_counts = {}
+            for timestamp in timestamps:
+                if timestamp != MISSING_TIMESTAMP:
+                    day = timestamp // 86400
+                    day_counts[day] = day_counts.get(day, 0) + 1
+            pairs = sorted(day_counts.items())
+        
+        epoch_date = EPOCH.date()
+        return {epoch_date + datetime.timedelta(days=day): count for day, count in pairs}
+    
+    def read_group(self, row: int) -> bytes:
+        """Reads the raw HTML of the message group in a row from its partition file"""
+        return next(self.iter_groups([row]))
+    
+    def iter_groups(self, rows) -> Iterator[bytes]:
+        """
+        Yields the raw HTML of the message groups in the given rows.
+        
+        Each group is read by seeking to its offset; files are kept open
+        while consecutive rows point into them.
+        """
+        files = self.columns["file"]
+        offsets = self.columns["offset"]
+        lengths = self.columns["length"]
+        
+        current_id = None
+        current = None
+        try:
+            for row in rows:
+                file_id = int(files[row])
+                if file_id != current_id:
+                    if current is not None:
+                        current.close()
+                    current = open(os.path.join(self.output_dir, self.files[file_id]), "rb")
+                    current_id = file_id
+                current.seek(int(offsets[row]))
+                yield current.read(int(lengths[row]))
+        finally:
+            if current is not None:
+                current.close()
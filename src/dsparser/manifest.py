@@ -0,0 +1,138 @@
+"""
+Checkpoint manifest for incremental and resumable runs.
+
+The manifest lives in the output folder and records every input chunk that
+has been fully written: its byte range, a hash of its content, the number of
+message groups it contributed to each partition, and the size of every
+partition file (without the footer) once the chunk was written.
+"""
+
+import json
+import os
+from typing import Optional
+
+
+MANIFEST_NAME = ".dsparser-manifest.json"
+MANIFEST_VERSION = 1
+
+
+def hash_chunk(data) -> str:
+    """
+    Hashes the content of an input chunk.
+    
+    Args:
+        data: Bytes-like chunk content
+    
+    Returns:
+        Hex digest of the chunk
+    """
+    import hashlib
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def new_manifest(input_file: str, partition: str) -> dict:
+    """
+    Creates an empty manifest for an input file.
+    
+    Args:
+        input_file: Path to input HTML file
+        partition: Name of the partitioning scheme
+    
+    Returns:
+        Manifest dictionary
+    """
+    return {
+        "version": MANIFEST_VERSION,
+        "input": os.path.basename(input_file),
+        "partition": partition,
+        "chunks": [],
+        "partitions": {},
+        "complete": False,
+    }
+
+
+def load_manifest(output_dir: str, partition: str) -> Optional[dict]:
+    """
+    Loads the manifest from an output folder.
+    
+    Args:
+        output_dir: Output folder
+        partition: Name of the partitioning scheme of this run
+    
+    Returns:
+        Manifest dictionary or None if there is no manifest usable with this scheme
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return None
+    
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("partition") != partition:
+        return None
+    return manifest
+
+
+def save_manifest(output_dir: str, manifest: dict) -> None:
+    """
+    Atomically writes the manifest to an output folder.
+    
+    Args:
+        output_dir: Output folder
+        manifest: Manifest dictionary
+    """
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, path)
+
+
+def count_verified_chunks(input_file: str, manifest: dict) -> int:
+    """
+    Counts the leading manifest chunks whose content is unchanged in the input.
+    
+    Args:
+        input_file: Path to input HTML file
+        manifest: Manifest of a previous run
+    
+    Returns:
+        Number of chunks, from the start, that can be skipped
+    """
+    total_size = os.path.getsize(input_file)
+    verified = 0
+    
+    with open(input_file, 'rb') as file:
+        for chunk in manifest["chunks"]:
+            if chunk["end"] > total_size:
+                break
+            file.seek(chunk["start"])
+            if hash_chunk(file.read(chunk["end"] - chunk["start"])) != chunk["hash"]:
+                break
+            verified += 1
+    
+    return verified
+
+
+def truncate_manifest(manifest: dict, verified: int) -> dict:
+    """
+    Drops every chunk after the verified prefix and recounts messages per partition.
+    
+    Args:
+        manifest: Manifest of a previous run
+        verified: Number of leading chunks to keep
+    
+    Returns:
+        The updated manifest
+    """
+    manifest["chunks"] = manifest["chunks"][:verified]
+    manifest["complete"] = False
+    
+    partitions = {}
+    for chunk in manifest["chunks"]:
+        for key, count in chunk["counts"].items():
+            partitions[key] = partitions.get(key, 0) + count
+    manifest["partitions"] = partitions
+    
+    return manifest
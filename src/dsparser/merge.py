@@ -0,0 +1,280 @@
+"""
+Merge mode: combines overlapping exports of one channel into a single
+deduplicated, chronologically ordered set of partition files.
+"""
+
+import heapq
+import mmap
+import os
+import re
+from collections import deque
+from contextlib import ExitStack
+
+from dsparser import parser
+from dsparser.assets import store_group_media
+from dsparser.batch import find_input_files
+from dsparser.index import timestamp_seconds, index_row, MISSING_TIMESTAMP
+from dsparser.partition import MessageInfo, resolve_partition, needs_author
+from dsparser.stream import iter_message_records
+from dsparser.utils.compression import detect_compression
+from dsparser.utils.scanner import DIV_TAG
+
+
+MESSAGE_ID = re.compile(rb'data-message-id="(\d+)"')
+
+# Discord snowflake ids hold milliseconds since 2015-01-01 in their upper bits
+DISCORD_EPOCH_MS = 1420070400000
+SNOWFLAKE_TIMESTAMP_SHIFT = 22
+# Time zone offsets are whole quarter hours
+UTC_OFFSET_STEP_MS = 15 * 60 * 1000
+
+DEFAULT_WINDOW_HOURS = 24
+BATCH_BYTES = 1024 * 1024
+
+
+def message_ids(group_bytes):
+    """Returns the Discord message ids of a message group in order"""
+    return [int(match) for match in MESSAGE_ID.findall(group_bytes)]
+
+
+def snowflake_milliseconds(message_id):
+    """Returns the time a Discord message id was created, in milliseconds since 1970-01-01 UTC"""
+    return (message_id >> SNOWFLAKE_TIMESTAMP_SHIFT) + DISCORD_EPOCH_MS
+
+
+def shown_milliseconds(record):
+    """Returns the timestamp of a message group as shown in the export in milliseconds, or None if it is incomplete"""
+    info = MessageInfo(record.year, record.month, record.day, record.author)
+    seconds = timestamp_seconds(info, record.timestamp)
+    return None if seconds == MISSING_TIMESTAMP else seconds * 1000
+
+
+def utc_offset(ids, shown):
+    """Returns the offset of the time zone an export is shown in from a group's first message id and shown time"""
+    return round((snowflake_milliseconds(ids[0]) - shown) / UTC_OFFSET_STEP_MS) * UTC_OFFSET_STEP_MS
+
+
+def first_utc_offset(mapped, with_author):
+    """Returns the offset of the first message group of an export with both ids and a complete timestamp, or 0"""
+    for record in iter_message_records(mapped, 0, with_author):
+        ids = message_ids(record.html)
+        shown = shown_milliseconds(record) if ids and record.year is not None else None
+        if shown is not None:
+            return utc_offset(ids, shown)
+    return 0
+
+
+def iter_merge_entries(mapped, with_author):
+    """
+    Yields (sort key, identities, record) for every dated message group of an export.
+    
+    Sort keys are milliseconds since 1970-01-01 UTC. A group with message ids
+    is keyed by the creation time of its first id, which does not depend on
+    the time zone the export was made in, and is identified by its ids. A
+    group without ids is keyed by its timestamp as shown, moved to UTC by the
+    offset between the shown times and the ids of the groups before it (or
+    of the first group with both), and is identified by a hash of its HTML.
+    A group without a complete timestamp gets the key of the group before it,
+    and keys never go back, so every export is sorted as heapq.merge() needs.
+    """
+    import hashlib
+    
+    offset = first_utc_offset(mapped, with_author)
+    previous = MISSING_TIMESTAMP
+    for record in iter_message_records(mapped, 0, with_author):
+        if record.year is None:
+            continue
+        ids = message_ids(record.html)
+        shown = shown_milliseconds(record)
+        if ids:
+            if shown is not None:
+                # Follows daylight saving time changes within the export
+                offset = utc_offset(ids, shown)
+            key = snowflake_milliseconds(ids[0])
+        else:
+            key = shown + offset if shown is not None else previous
+            ids = [hashlib.blake2b(record.html, digest_size=16).digest()]
+        
+        previous = max(key, previous)
+        yield previous, ids, record
+
+
+def drop_messages(group_bytes, dropped_ids):
+    """
+    Removes messages from the HTML of a message group.
+    
+    Args:
+        group_bytes: Raw HTML of the message group
+        dropped_ids: Message ids to remove
+    
+    Returns:
+        HTML of the group without the <div> elements that carry those ids
+    """
+    parts = []
+    position = 0
+    for match in MESSAGE_ID.finditer(group_bytes):
+        if int(match.group(1)) not in dropped_ids:
+            continue
+        start = group_bytes.rfind(b'<div', position, match.start())
+        if start == -1:
+            continue
+        depth = 0
+        for tag in DIV_TAG.finditer(group_bytes, start):
+            depth += -1 if tag.group().startswith(b'</') else 1
+            if depth == 0:
+                end = tag.end()
+                # The line break after the message goes with it
+                if group_bytes[end:end + 1] == b'\n':
+                    end += 1
+                parts.append(group_bytes[position:start])
+                position = end
+                break
+    parts.append(group_bytes[position:])
+    return b"".join(parts)
+
+
+class RecentIdentities:
+    """
+    Exact set of the message identities seen within a sliding time window.
+    
+    Copies of a message in overlapping exports meet within a short time of
+    each other in the merged stream, so identities older than the window
+    are forgotten and memory stays bounded by the busiest window instead of
+    growing with the number of messages.
+    """
+    
+    def __init__(self, window_ms):
+        self.window_ms = window_ms
+        self.identities = set()
+        self.expiry = deque()
+    
+    def __len__(self):
+        return len(self.identities)
+    
+    def advance(self, key):
+        """Forgets the identities that are older than the window before key"""
+        while self.expiry and self.expiry[0][0] < key - self.window_ms:
+            self.identities.discard(self.expiry.popleft()[1])
+    
+    def unseen(self, identities):
+        """Returns the identities that were not seen within the window, in order"""
+        return [identity for identity in identities if identity not in self.identities]
+    
+    def add(self, key, identities):
+        for identity in identities:
+            if identity not in self.identities:
+                self.identities.add(identity)
+                self.expiry.append((key, identity))
+
+
+def parse_discord_html_merge(inputs, output_dir, partition="year", window_hours=DEFAULT_WINDOW_HOURS,
+                             queue_size=parser.DEFAULT_QUEUE_SIZE, memory_budget_mb=None,
+                             write_buffer_mb=parser.DEFAULT_WRITE_BUFFER_MB, fsync="none",
+                             max_open_files=parser.DEFAULT_MAX_OPEN_FILES, compress=None, index=False,
+                             shared_assets=False, shared_media=False):
+    """
+    Merges exports of the same channel, writing every message group once in chronological order.
+    
+    The message groups of all exports are merged by the creation time of
+    their first message in UTC, which each export already has in order, see
+    iter_merge_entries(). A group is skipped when all of its message ids were
+    already written; from a group that only partly overlaps an earlier one,
+    for example one that grew between two exports, only the messages not yet
+    written are kept. Groups without message ids are identified by a hash of
+    their HTML.
+    
+    Args:
+        inputs: File paths, directories and glob patterns of the exports
+        output_dir: Folder for the merged partition files
+        partition: Partitioning scheme, see resolve_partition()
+        window_hours: How long after a message its copies are still recognized.
+            Exports whose messages are out of order by more than this can
+            leave duplicates
+        queue_size: Maximum number of batches waiting in each writer queue
+        memory_budget_mb: Approximate limit of the queued output in MB
+        write_buffer_mb: Size of the write buffer of each output file in MB
+        fsync: When to fsync output files, "none", "close" or "batch"
+        max_open_files: Maximum number of output files kept open at once
+        compress: Output compression, None, "gzip" or "zstd"
+        index: Whether to also write a message index
+        shared_assets: Whether to store the stylesheets and embedded images of
+            the header once in an assets folder instead of in every file
+        shared_media: Whether to also move the large embedded data: URIs of
+            message groups to the assets folder
+    
+    Returns:
+        Tuple (written, duplicates) with the number of message groups
+    """
+    files = [path for path in find_input_files(inputs) if os.path.getsize(path) > 0]
+    if not files:
+        print("No input files found.")
+        return 0, 0
+    
+    if index and compress:
+        raise ValueError("The message index does not support compressed output")
+    
+    compressed = [path for path in files if detect_compression(path) is not None]
+    if compressed:
+        raise ValueError(f"Merge mode does not support compressed input files: {compressed[0]}")
+    
+    key_function = resolve_partition(partition)
+    with_author = needs_author(key_function) or index
+    
+    os.makedirs(output_dir, exist_ok=True)
+    parser.extract_html_parts(files[0])
+    
+    queue_bytes_limit = memory_budget_mb * 1024 * 1024 // 2 if memory_budget_mb else None
+    parser.start_output(output_dir, queue_size, queue_bytes_limit, write_buffer_mb, fsync,
+                        key_function, max_open_files, compress, index,
+                        shared_assets=shared_assets, shared_media=shared_media)
+    
+    def put_batch(groups_by_key, rows_by_key):
+        if parser.media_store is not None:
+            store_group_media(groups_by_key, parser.media_store)
+        parser.put_groups_by_key(groups_by_key, rows_by_key)
+    
+    seen = RecentIdentities(int(window_hours * 3600 * 1000))
+    written = duplicates = 0
+    
+    try:
+        with ExitStack() as stack:
+            streams = []
+            for input_file in files:
+                file = stack.enter_context(open(input_file, 'rb'))
+                mapped = stack.enter_context(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+                streams.append(iter_merge_entries(mapped, with_author))
+            
+            print(f"Merging {len(files)} files")
+            groups_by_key = {}
+            rows_by_key = {} if index else None
+            batch_bytes = 0
+            for key, identities, record in heapq.merge(*streams, key=lambda entry: entry[0]):
+                seen.advance(key)
+                unseen = seen.unseen(identities)
+                if not unseen:
+                    duplicates += 1
+                    continue
+                if len(unseen) < len(identities):
+                    record = record._replace(html=drop_messages(record.html, set(identities) - set(unseen)))
+                seen.add(key, unseen)
+                written += 1
+                
+                info = MessageInfo(record.year, record.month, record.day, record.author)
+                partition_key = key_function(info)
+                groups_by_key.setdefault(partition_key, []).append(record.html)
+                if rows_by_key is not None:
+                    rows_by_key.setdefault(partition_key, []).append(index_row(info, record.timestamp))
+                batch_bytes += len(record.html)
+                if batch_bytes >= BATCH_BYTES:
+                    put_batch(groups_by_key, rows_by_key)
+                    groups_by_key = {}
+                    rows_by_key = {} if index else None
+                    batch_bytes = 0
+            
+            if groups_by_key:
+                put_batch(groups_by_key, rows_by_key)
+    finally:
+        parser.finish_output()
+    
+    print(f"Wrote {written:,} message groups, skipped {duplicates:,} duplicates")
+    return written, duplicates
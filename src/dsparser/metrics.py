@@ -0,0 +1,319 @@
+"""
+Opt-in run metrics and profiling.
+
+The parser reports stage timings, counters and queue depths to
+run_metrics. Reporting is a no-op until collect_metrics() enables it, so
+normal runs pay only for an attribute check per call. The profilers and
+tracemalloc are imported when they are first used.
+"""
+
+import bisect
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+HISTOGRAM_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+SAMPLE_INTERVAL = 0.1
+TRACEMALLOC_TOP = 25
+PROMETHEUS_PREFIX = "dsparser_"
+
+
+def metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, histograms and sampled gauges.
+    
+    Histograms hold durations in seconds. Gauges are sampled periodically
+    by the functions registered with add_sampler() while metrics are
+    collected, keeping the last, maximum and mean value.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.samplers = []
+        self.reset(False)
+    
+    def reset(self, enabled):
+        """Clears all metrics and enables or disables collection"""
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.gauges = {}
+            self.info = {}
+            self.started = time.time()
+            self.enabled = enabled
+    
+    def add_sampler(self, sampler):
+        """Registers a function that is called periodically to sample gauges"""
+        self.samplers.append(sampler)
+    
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter"""
+        if not self.enabled:
+            return
+        key = metric_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def observe(self, name, seconds, **labels):
+        """Records a duration in a histogram"""
+        if not self.enabled:
+            return
+        key = metric_key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * (len(HISTOGRAM_BUCKETS) + 1), "sum": 0.0, "count": 0}
+            histogram["buckets"][bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+    
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the enclosed block into a histogram"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+    
+    def sample(self, name, value, **labels):
+        """Records a sample of a gauge"""
+        if not self.enabled:
+            return
+        key = metric_key(name, labels)
+        with self.lock:
+            gauge = self.gauges.get(key)
+            if gauge is None:
+                gauge = self.gauges[key] = {"last": value, "max": value, "sum": 0, "samples": 0}
+            gauge["last"] = value
+            gauge["max"] = max(gauge["max"], value)
+            gauge["sum"] += value
+            gauge["samples"] += 1
+    
+    def run_samplers(self):
+        for sampler in self.samplers:
+            sampler(self)
+    
+    def snapshot(self):
+        """Returns all metrics as a JSON-serializable dictionary"""
+        def entry(key, values):
+            name, labels = key
+            return dict(name=name, labels=dict(labels), **values)
+        
+        with self.lock:
+            return {
+                "started": self.started,
+                "duration": time.time() - self.started,
+                "counters": [entry(key, {"value": value}) for key, value in sorted(self.counters.items())],
+                "histograms": [
+                    entry(key, {
+                        "count": histogram["count"],
+                        "sum": histogram["sum"],
+                        "buckets": dict(zip([str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"], histogram["buckets"])),
+                    })
+                    for key, histogram in sorted(self.histograms.items())
+                ],
+                "gauges": [
+                    entry(key, {
+                        "last": gauge["last"],
+                        "max": gauge["max"],
+                        "mean": gauge["sum"] / gauge["samples"] if gauge["samples"] else 0,
+                    })
+                    for key, gauge in sorted(self.gauges.items())
+                ],
+                **self.info,
+            }
+    
+    def to_prometheus(self):
+        """Returns all metrics in the Prometheus text exposition format, for the node exporter textfile collector"""
+        def labels_text(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+        
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name}_total counter")
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name == name:
+                        lines.append(f"{PROMETHEUS_PREFIX}{name}_total{labels_text(labels)} {value}")
+            
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} histogram")
+                for (key_name, labels), histogram in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(HISTOGRAM_BUCKETS) + ["+Inf"], histogram["buckets"]):
+                        cumulative += count
+                        lines.append(f"{PROMETHEUS_PREFIX}{name}_bucket{labels_text(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{PROMETHEUS_PREFIX}{name}_sum{labels_text(labels)} {histogram['sum']}")
+                    lines.append(f"{PROMETHEUS_PREFIX}{name}_count{labels_text(labels)} {histogram['count']}")
+            
+            for name in sorted({name for name, _ in self.gauges}):
+                for statistic in ("last", "max"):
+                    suffix = "" if statistic == "last" else "_max"
+                    lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name}{suffix} gauge")
+                    for (key_name, labels), gauge in sorted(self.gauges.items()):
+                        if key_name == name:
+                            lines.append(f"{PROMETHEUS_PREFIX}{name}{suffix}{labels_text(labels)} {gauge[statistic]}")
+            
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}run_duration_seconds gauge")
+            lines.append(f"{PROMETHEUS_PREFIX}run_duration_seconds {time.time() - self.started}")
+        
+        return "\n".join(lines) + "\n"
+
+
+run_metrics = Metrics()
+
+# Profilers of the threads that called profile_thread() during collect_metrics()
+thread_profiles = []
+profiling = False
+# Counts the collect_metrics() runs that profiled, so threads notice a new run
+profiling_run = 0
+# Thread that runs collect_metrics(), profiled by its own profiler
+profiling_thread = None
+thread_state = threading.local()
+
+
+def profile_thread():
+    """
+    Profiles the calling thread while collect_metrics() is profiling and stops profiling it afterwards.
+    
+    A profiler can only be disabled by its own thread, so this is called at
+    the start of writer threads, as the initializer of worker thread pools
+    and by the tasks of pools that are kept between runs. On Python 3.12 and
+    later one profiler already covers every thread, and this does nothing.
+    """
+    if threading.get_ident() == profiling_thread:
+        return
+    profile = getattr(thread_state, "profile", None)
+    if profile is not None and not (profiling and thread_state.run == profiling_run):
+        profile.disable()
+        thread_state.profile = profile = None
+    if not profiling or profile is not None:
+        return
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return
+    thread_state.profile = profile
+    thread_state.run = profiling_run
+    thread_profiles.append(profile)
+
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process, or None where it is not available"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def write_metrics(metrics, metrics_out):
+    """Writes metrics to a file, in the Prometheus text format if it ends with .prom and as JSON otherwise"""
+    with open(metrics_out, 'w', encoding='utf-8') as file:
+        if metrics_out.endswith(".prom"):
+            file.write(metrics.to_prometheus())
+        else:
+            json.dump(metrics.snapshot(), file, indent=2)
+
+
+@contextmanager
+def collect_metrics(metrics_out=None, profile_out=None, trace_memory=False, sample_interval=SAMPLE_INTERVAL):
+    """
+    Collects metrics of the runs in the enclosed block.
+    
+    Args:
+        metrics_out: File for the metrics, see write_metrics(). None to skip
+        profile_out: File for cProfile statistics of the main process, readable
+            with pstats or snakeviz. None to skip profiling
+        trace_memory: Trace allocations with tracemalloc and add the largest
+            allocation sites and the peak to the metrics
+        sample_interval: Seconds between samples of queue depths
+    
+    Yields:
+        The Metrics being collected
+    """
+    global profiling, profiling_run, profiling_thread
+    
+    if not (metrics_out or profile_out or trace_memory):
+        yield run_metrics
+        return
+    
+    run_metrics.reset(True)
+    stop_sampling = threading.Event()
+    
+    def sample_loop():
+        while not stop_sampling.wait(sample_interval):
+            run_metrics.run_samplers()
+    
+    sampler = threading.Thread(target=sample_loop, name="dsparser-metrics", daemon=True)
+    sampler.start()
+    
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    
+    main_profile = None
+    if profile_out:
+        import cProfile
+        thread_profiles.clear()
+        main_profile = cProfile.Profile()
+        main_profile.enable()
+        profiling_thread = threading.get_ident()
+        profiling_run += 1
+        profiling = True
+    
+    try:
+        yield run_metrics
+    finally:
+        if main_profile is not None:
+            # Profiled threads disable their profilers on their next task or when they end
+            profiling = False
+            profiling_thread = None
+            main_profile.disable()
+            import pstats
+            stats = pstats.Stats(main_profile)
+            for profile in thread_profiles:
+                stats.add(profile)
+            thread_profiles.clear()
+            stats.dump_stats(profile_out)
+        
+        stop_sampling.set()
+        sampler.join()
+        
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            run_metrics.info["tracemalloc"] = {
+                "peak_bytes": peak,
+                "top": [
+                    {"location": str(stat.traceback), "size": stat.size, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+                ],
+            }
+        
+        run_metrics.info["peak_rss_bytes"] = peak_rss_bytes()
+        if metrics_out:
+            write_metrics(run_metrics, metrics_out)
+        run_metrics.enabled = False
@@ -1,169 +1,927 @@
 import os
-from tqdm import tqdm
-from bs4 import BeautifulSoup, SoupStrainer
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 import threading
 import queue
-import re
+import time
 
-from dsparser.utils.html_helpers import extract_html_header_footer, parse_message_date
+from dsparser.utils.html_helpers import extract_html_header_footer, parse_message_timestamp
+from dsparser.utils.timestamps import timestamp_classifier
+from dsparser.utils.scanner import iter_group_spans
+from dsparser.utils.reader import split_ranges, read_message_range, iter_stream_chunks, read_export_start
+from dsparser.utils.compression import (
+    COMPRESSION_SUFFIXES, detect_compression, open_input, open_output, iter_decompressed_blocks
+)
+from dsparser.index import IndexWriter, index_row
+from dsparser.assets import AssetStore, ASSET_DIR, store_group_media
+from dsparser.backends import resolve_backend
+from dsparser.metrics import run_metrics, profile_thread
+from dsparser.manifest import (
+    hash_chunk, new_manifest, load_manifest, save_manifest, count_verified_chunks, truncate_manifest
+)
+from dsparser.partition import (
+    by_year, resolve_partition, partition_name, needs_author, partition_file_name, parse_message_info,
+    channel_dir_name
+)
 
 
-year_queues = {}
+writer_queues = []
+writer_threads = []
+writer_errors = {}
+partition_writers = {}
 
 queue_lock = threading.Lock()
 
+output_directory = None
+partition_key = by_year
+max_open_files = 0
+write_buffer_size = -1
+fsync_policy = "none"
+output_compression = None
+message_index = None
+parser_backend = None
+
+queued_bytes = 0
+queued_bytes_limit = None
+queued_bytes_cond = threading.Condition()
+
+reorder_buffer = {}
+next_sequence = 0
+reorder_cond = threading.Condition()
+
+manifest = None
+manifest_lock = threading.Lock()
+pending_checkpoints = {}
+resume_offsets = {}
+checkpoints_enabled = False
+
+CHECKPOINT = object()
+
+# Worker pools by (mode, workers) kept between runs by a long-lived process, None to start a pool per run
+kept_pools = None
+
 html_header = None
 html_footer = None
+channel_headers = {}
+asset_store = None
+media_store = None
+output_headers = {}
+
+# Batches waiting per writer; a batch holds up to one chunk, so this bounds queued output to
+# WRITER_THREADS * DEFAULT_QUEUE_SIZE chunks
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_WRITE_BUFFER_MB = 1
+DEFAULT_MAX_OPEN_FILES = 256
+WRITER_THREADS = 4
+CHATLOG_START = b'<div class="chatlog">\n'
+REORDER_WINDOW_FACTOR = 4
+PARSE_MEMORY_FACTOR = 8
+
+def progress_bar(*args, **kwargs):
+    """Returns a tqdm progress bar, importing tqdm on first use since it is slow to import"""
+    from tqdm import tqdm
+    return tqdm(*args, **kwargs)
+
+def new_worker_pool(workers, mode="threads"):
+    """Starts a pool of worker processes or threads, importing concurrent.futures on first use"""
+    if mode == "processes":
+        # Imported on use, it pulls in multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers)
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=workers, initializer=profile_thread)
+
+@contextmanager
+def worker_pool(workers, mode="threads"):
+    """Yields a pool of workers for a run, shutting it down afterwards unless pools are kept.
+    
+    With keep_worker_pools(), a pool is started the first time a run asks
+    for its mode and number of workers and reused by later runs. A broken
+    process pool is dropped, so the next run starts a new one.
+    """
+    from concurrent.futures import BrokenExecutor
+    
+    if kept_pools is None:
+        with new_worker_pool(workers, mode) as pool:
+            yield pool
+        return
+    
+    key = (mode, workers)
+    pool = kept_pools.get(key)
+    if pool is None:
+        pool = kept_pools[key] = new_worker_pool(workers, mode)
+    try:
+        yield pool
+    except BrokenExecutor:
+        kept_pools.pop(key, None)
+        raise
+
+def keep_worker_pools():
+    """Keeps the worker pools of runs for later runs, in a long-lived process"""
+    global kept_pools
+    if kept_pools is None:
+        kept_pools = {}
+
+def shutdown_worker_pools():
+    """Shuts the kept worker pools down and starts a pool per run again"""
+    global kept_pools
+    pools, kept_pools = kept_pools or {}, None
+    for pool in pools.values():
+        pool.shutdown()
+
+def read_html_start(input_file):
+    """Reads the header of an HTML file, which may be compressed, and a sample of its messages"""
+    with open_input(input_file) as file:
+        start_content = read_export_start(file)
+    
+    return start_content.decode('utf-8', errors='replace')
+
+def read_html_parts(input_file):
+    """Reads header and footer from the beginning of an HTML file"""
+    return extract_html_header_footer(read_html_start(input_file))
 
 def extract_html_parts(input_file):
-    """Extracts header and footer from HTML file for use in output files"""
-    global html_header, html_footer
+    """Extracts header and footer from HTML file for use in output files.
     
-    with open(input_file, 'r', encoding='utf-8') as file:
-        start_content = file.read(100 * 1024)  # 100 KB
+    The message groups in the same sample are used to detect the date
+    format of the export for the timestamp classifier.
+    """
+    global html_header, html_footer
     
+    start_content = read_html_start(input_file)
     html_header, html_footer = extract_html_header_footer(start_content)
+    timestamp_classifier.detect(start_content)
+
+def split_byte_ranges(input_file, chunk_size, start=0):
+    """Splits the file from start into byte ranges of chunk_size bytes, which workers realign to message groups"""
+    return split_ranges(start, os.path.getsize(input_file), chunk_size)
+
+def soup_groups_by_key(content, key_function=by_year, backend="auto", rows_by_key=None):
+    """Parses HTML text with a parser backend and returns serialized message groups by partition key.
+    
+    With a dictionary as rows_by_key, the index_row() of every group is added
+    to it under the group's partition key, in the order of the groups.
+    """
+    backend = resolve_backend(backend)
+    with_author = needs_author(key_function) or rows_by_key is not None
+    
+    groups_by_key = {}
+    for group in backend.parse(content):
+        info = backend.classify(group, with_author)
+        if info is not None:
+            key = key_function(info)
+            group_html = backend.serialize(group)
+            groups_by_key.setdefault(key, []).append(group_html.encode('utf-8'))
+            if rows_by_key is not None:
+                rows_by_key.setdefault(key, []).append(index_row(info, parse_message_timestamp(group_html)))
+    
+    return groups_by_key
+
+def scan_groups_by_key(data, key_function=by_year, backend="auto", rows_by_key=None):
+    """Scans raw bytes for message groups and returns their original HTML by partition key.
+    
+    Falls back to the parser backend for the remainder of the data if a group
+    is malformed. Index rows are added to rows_by_key like soup_groups_by_key() does.
+    """
+    with_author = needs_author(key_function) or rows_by_key is not None
+    
+    groups_by_key = {}
+    try:
+        for start, end in iter_group_spans(data):
+            group_bytes = data[start:end]
+            group_html = group_bytes.decode('utf-8', errors='replace')
+            info = parse_message_info(group_html, with_author)
+            if info is not None:
+                key = key_function(info)
+                groups_by_key.setdefault(key, []).append(group_bytes)
+                if rows_by_key is not None:
+                    rows_by_key.setdefault(key, []).append(index_row(info, parse_message_timestamp(group_html)))
+    except ValueError as e:
+        remainder = data[e.args[1]:].decode('utf-8', errors='replace')
+        for key, groups in soup_groups_by_key(remainder, key_function, backend, rows_by_key).items():
+            groups_by_key.setdefault(key, []).extend(groups)
+    
+    return groups_by_key
+
+def parse_byte_range(input_file, start, end, engine="soup", checksum=False, key_function=by_year, backend="auto",
+                     channel=None, media=None, index_rows=False):
+    """Parses the message groups that start in a byte range of the file, realigning the range to group boundaries.
+    
+    With a channel, message groups are returned under the partition key
+    (channel, key). With an AssetStore as media, the large embedded data:
+    URIs of the groups are moved to the store.
+    
+    Returns:
+        Tuple (groups_by_key, chunk, stage_seconds, rows_by_key), where chunk has
+        the realigned "start" and "end" and a "hash" that is None unless checksum
+        is set, stage_seconds maps "read" and "parse" to the time spent on them,
+        for the metrics of the collecting process, and rows_by_key holds the
+        index rows of the groups if index_rows is set and is None otherwise
+    """
+    profile_thread()
+    read_start = time.perf_counter()
+    with open(input_file, 'rb') as file:
+        group_start, group_end, data = read_message_range(file, start, end, os.fstat(file.fileno()).st_size)
+    
+    chunk = {"start": group_start, "end": group_end, "hash": hash_chunk(data) if checksum else None}
+    parse_start = time.perf_counter()
+    rows_by_key = {} if index_rows else None
+    groups_by_key = parse_chunk_bytes(data, engine, key_function, backend, rows_by_key)
+    if channel is not None:
+        groups_by_key = {(channel, key): groups for key, groups in groups_by_key.items()}
+        if rows_by_key is not None:
+            rows_by_key = {(channel, key): rows for key, rows in rows_by_key.items()}
+    if media is not None:
+        store_group_media(groups_by_key, media)
+    
+    stage_seconds = {"read": parse_start - read_start, "parse": time.perf_counter() - parse_start}
+    return groups_by_key, chunk, stage_seconds, rows_by_key
+
+def parse_chunk_timed(data, engine="soup", key_function=by_year, backend="auto", media=None, index_rows=False):
+    """Parses a chunk of raw bytes like parse_chunk_bytes and also returns the seconds it took.
+    
+    With an AssetStore as media, the large embedded data: URIs of the groups
+    are moved to the store.
+    
+    Returns:
+        Tuple (groups_by_key, seconds, rows_by_key), where rows_by_key holds the
+        index rows of the groups if index_rows is set and is None otherwise
+    """
+    profile_thread()
+    parse_start = time.perf_counter()
+    rows_by_key = {} if index_rows else None
+    groups_by_key = parse_chunk_bytes(data, engine, key_function, backend, rows_by_key)
+    if media is not None:
+        store_group_media(groups_by_key, media)
+    return groups_by_key, time.perf_counter() - parse_start, rows_by_key
+
+def parse_chunk_bytes(data, engine="soup", key_function=by_year, backend="auto", rows_by_key=None):
+    """Parses a chunk of raw bytes with the given engine and returns its message groups by partition key"""
+    if engine == "scan":
+        return scan_groups_by_key(data, key_function, backend, rows_by_key)
+    return soup_groups_by_key(data.decode('utf-8', errors='replace'), key_function, backend, rows_by_key)
 
-def parse_discord_html(input_file, output_dir, workers=4, chunk_size_mb=10):
+def record_chunk_metrics(chunk_size, groups_by_key, stage_seconds):
+    """Records the size, message groups and stage timings of a parsed chunk"""
+    if not run_metrics.enabled:
+        return
+    run_metrics.inc("chunks")
+    run_metrics.inc("input_bytes", chunk_size)
+    run_metrics.inc("message_groups", sum(len(groups) for groups in groups_by_key.values()))
+    for stage, seconds in stage_seconds.items():
+        run_metrics.observe("stage_seconds", seconds, stage=stage)
+
+def parse_discord_html(input_file, output_dir, workers=4, chunk_size_mb=10, mode="threads", engine="soup",
+                       queue_size=DEFAULT_QUEUE_SIZE, memory_budget_mb=None,
+                       write_buffer_mb=DEFAULT_WRITE_BUFFER_MB, fsync="none", ordered=False, resume=False,
+                       partition="year", max_open_files=DEFAULT_MAX_OPEN_FILES, compress=None, index=False,
+                       backend="auto", shared_assets=False, shared_media=False):
+    input_compression = detect_compression(input_file)
+    if resume and (input_compression or compress):
+        # Checkpoints record offsets into the input and the output files
+        raise ValueError("Resumable runs do not support compressed input or output")
+    if index and (resume or compress):
+        raise ValueError("The message index does not support resumable runs or compressed output")
+    
     os.makedirs(output_dir, exist_ok=True)
     
     extract_html_parts(input_file)
     
-    total_size = os.path.getsize(input_file)
+    queue_bytes_limit = None
+    if memory_budget_mb:
+        chunk_size_mb, queue_bytes_limit = split_memory_budget(memory_budget_mb, workers, chunk_size_mb)
     
-    global year_queues
+    # Checkpoints are only meaningful when chunks are written in input order
+    ordered = ordered or resume
     
-    only_messages = SoupStrainer("div", class_="chatlog__message-group")
+    start_output(output_dir, queue_size, queue_bytes_limit, write_buffer_mb, fsync,
+                 resolve_partition(partition), max_open_files, compress, index, backend, shared_assets,
+                 shared_media)
     
-    chunk_size = chunk_size_mb * 1024 * 1024  # convert MB to bytes
-    buffer = ""
-    processed_size = 0
+    try:
+        start_offset = 0
+        if resume:
+            start_offset = start_manifest(input_file)
+            if start_offset is None:
+                print("Input is unchanged since the last run, nothing to do.")
+                return
+        
+        if input_compression is not None:
+            parse_discord_html_stream(input_file, workers, chunk_size_mb, mode, engine, ordered)
+        elif mode == "processes" or engine == "scan":
+            parse_discord_html_ranges(input_file, workers, chunk_size_mb, mode, engine, ordered, start_offset)
+        else:
+            parse_discord_html_chunks(input_file, workers, chunk_size_mb, ordered, start_offset)
+    finally:
+        finish_output()
+        if resume:
+            finish_manifest()
+
+def split_memory_budget(memory_budget_mb, workers, chunk_size_mb):
+    """Splits a memory budget between in-flight chunks and queued output.
+    
+    Half of the budget goes to chunks being parsed, which take about
+    PARSE_MEMORY_FACTOR times their size while in flight, and half to
+    message groups waiting in the writer queues.
+    
+    Returns:
+        Tuple (chunk_size_mb, queue_bytes_limit)
+    """
+    half_budget = memory_budget_mb * 1024 * 1024 // 2
+    max_chunk_mb = half_budget // (workers * 2 * PARSE_MEMORY_FACTOR) // (1024 * 1024)
+    return max(1, min(chunk_size_mb, max_chunk_mb)), max(1, half_budget)
+
+def parse_discord_html_chunks(input_file, workers=4, chunk_size_mb=10, ordered=False, start_offset=0):
+    """Parses the file in byte ranges with a thread pool.
     
-    writer_executor = ThreadPoolExecutor(max_workers=8)
-    writer_futures = {}
+    Each worker realigns its own range to message group boundaries and reads
+    it from the shared file with pread, so the main thread only hands out
+    offsets and every worker is busy from the start.
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
     
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        with open(input_file, 'r', encoding='utf-8') as file, tqdm(total=total_size, unit='B', unit_scale=True, desc='Processing file') as pbar:
+    total_size = os.path.getsize(input_file)
+    
+    chunk_size = chunk_size_mb * 1024 * 1024  # convert MB to bytes
+    max_pending = workers * 2
+    reorder_window = workers * REORDER_WINDOW_FACTOR
+    
+    with worker_pool(workers) as executor:
+        with open(input_file, 'rb') as file, progress_bar(total=total_size, initial=start_offset, unit='B', unit_scale=True, desc='Processing file') as pbar:
             futures = []
+            pending = set()
             
-            try:
-                while True:
-                    chunk = file.read(chunk_size)
-                    if not chunk:
-                        if buffer:
-                            soup = BeautifulSoup(buffer, 'html.parser', parse_only=only_messages)
-                            future = executor.submit(process_messages_batch, soup)
-                            futures.append(future)
-                        break
-                    
-                    chunk_size_bytes = len(chunk.encode('utf-8'))
-                    processed_size += chunk_size_bytes
-                    pbar.update(chunk_size_bytes)
-                    
-                    buffer += chunk
-                    
-                    last_div_pos = buffer.rfind('</div>')
-                    if last_div_pos > 0:
-                        valid_part = buffer[:last_div_pos+6]  # +6 to include '</div>'
-                        
-                        soup = BeautifulSoup(valid_part, 'html.parser', parse_only=only_messages)
-                        future = executor.submit(process_messages_batch, soup)
-                        futures.append(future)
-                        
-                        buffer = buffer[last_div_pos+6:]
-                
-                for future in tqdm(as_completed(futures), total=len(futures), desc="Finishing message processing"):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"Error processing messages: {e}")
-                
-                with queue_lock:
-                    for year in year_queues.keys():
-                        if year not in writer_futures:
-                            year_path = os.path.join(output_dir, f"{year}.html")
-                            writer_futures[year] = writer_executor.submit(year_file_writer, year, year_path)
-                
-                with queue_lock:
-                    for q in year_queues.values():
-                        q.put(None)
-                
-                for year, future in tqdm(writer_futures.items(), desc="Saving files by year"):
-                    try:
-                        future.result()
-                    except Exception as e:
-                        print(f"Error writing file for {year}: {e}")
+            for sequence, (start, end) in enumerate(split_ranges(start_offset, total_size, chunk_size)):
+                if len(pending) >= max_pending:
+                    with run_metrics.timer("wait_seconds", stage="workers"):
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if ordered:
+                    wait_for_reorder_window(sequence, reorder_window)
                 
-            finally:
-                if 'writer_futures' in locals():
-                    with queue_lock:
-                        for q in year_queues.values():
-                            try:
-                                q.put(None)
-                            except:
-                                pass
-                    
-                    for year, future in writer_futures.items():
-                        try:
-                            future.result(timeout=5)
-                        except:
-                            pass
-                
-                writer_executor.shutdown(wait=False)
+                future = executor.submit(process_byte_range, file, start, end, total_size, sequence if ordered else None)
+                futures.append(future)
+                pending.add(future)
+                pbar.update(end - start)
+            
+            wait(pending)
+            
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Error processing messages: {e}")
 
-def year_file_writer(year, file_path):
-    """Function for writing messages to a file for a specific year from the queue"""
-    global html_header, html_footer
+def parse_discord_html_ranges(input_file, workers=4, chunk_size_mb=10, mode="processes", engine="soup",
+                              ordered=False, start_offset=0):
+    """Parses the file by byte ranges, each worker reading and parsing its own range"""
+    chunk_size = chunk_size_mb * 1024 * 1024
+    tasks = [(input_file, start, end, None) for start, end in split_byte_ranges(input_file, chunk_size, start_offset)]
     
-    with open(file_path, "w", encoding="utf-8") as file:
-        file.write(html_header)
-        file.write('<div class="chatlog">\n')
+    run_range_tasks(tasks, os.path.getsize(input_file), workers, mode, engine, ordered, start_offset)
+
+def parse_discord_html_stream(input_file, workers=4, chunk_size_mb=10, mode="threads", engine="soup", ordered=False):
+    """Parses a compressed file, decompressing it as a stream and cutting it into chunks on message group boundaries.
+    
+    Chunks are collected in input order, so at most workers * 2 chunks are
+    held in memory and ordered output needs no reorder window.
+    """
+    chunk_size = chunk_size_mb * 1024 * 1024
+    max_pending = workers * 2
+    
+    with worker_pool(workers, mode) as executor, progress_bar(unit='B', unit_scale=True, desc='Processing file') as pbar:
+        pending = deque()
         
-        while True:
-            message = year_queues[year].get()
-            if message is None:
-                break
-            file.write(message)
+        def collect():
+            sequence, future, chunk_length = pending.popleft()
+            try:
+                with run_metrics.timer("wait_seconds", stage="workers"):
+                    groups_by_key, parse_seconds, rows_by_key = future.result()
+                record_chunk_metrics(chunk_length, groups_by_key, {"parse": parse_seconds})
+            except Exception as e:
+                print(f"Error processing messages: {e}")
+                groups_by_key, rows_by_key = {}, None
+            pbar.update(chunk_length)
+            
+            if ordered:
+                put_ordered_batch(sequence, groups_by_key, rows_by_key=rows_by_key)
+            else:
+                put_groups_by_key(groups_by_key, rows_by_key)
         
-        file.write(html_footer)
+        blocks = iter_decompressed_blocks(input_file, workers)
+        for sequence, (_, data) in enumerate(iter_stream_chunks(blocks, chunk_size)):
+            if len(pending) >= max_pending:
+                collect()
+            future = executor.submit(parse_chunk_timed, data, engine, partition_key, parser_backend, media_store,
+                                     message_index is not None)
+            pending.append((sequence, future, len(data)))
+        
+        while pending:
+            collect()
 
-def process_messages_batch(soup):
-    """Processes a batch of messages from the soup"""
-    message_groups = soup.find_all("div", class_="chatlog__message-group")
+def run_range_tasks(tasks, total_size, workers=4, mode="processes", engine="soup", ordered=False, initial_size=0):
+    """Parses byte ranges on a shared worker pool and queues their message groups.
+    
+    Each task is a tuple (input_file, start, end, channel). Message groups of
+    a task with a channel are queued under the partition key (channel, key).
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
     
+    max_pending = workers * 2
+    reorder_window = workers * REORDER_WINDOW_FACTOR
     
-    for group in message_groups:
-        timestamp_spans = group.find_all("span", class_="chatlog__timestamp")
+    with worker_pool(workers, mode) as executor, progress_bar(total=total_size, initial=initial_size, unit='B', unit_scale=True, desc='Processing file') as pbar:
+        pending = {}
         
-        if not timestamp_spans:
-            continue
+        def collect(return_when):
+            with run_metrics.timer("wait_seconds", stage="workers"):
+                done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                sequence, (start, end, _) = pending.pop(future)
+                pbar.update(end - start)
+                try:
+                    groups_by_key, chunk, stage_seconds, rows_by_key = future.result()
+                    record_chunk_metrics(end - start, groups_by_key, stage_seconds)
+                    if not checkpoints_enabled:
+                        chunk = None
+                except Exception as e:
+                    print(f"Error processing messages: {e}")
+                    groups_by_key, chunk, rows_by_key = {}, None, None
+                
+                if ordered:
+                    put_ordered_batch(sequence, groups_by_key, chunk, rows_by_key)
+                else:
+                    put_groups_by_key(groups_by_key, rows_by_key)
+        
+        for sequence, (input_file, start, end, channel) in enumerate(tasks):
+            while pending and (len(pending) >= max_pending or (ordered and sequence - next_sequence >= reorder_window)):
+                collect(FIRST_COMPLETED)
             
-        timestamp_span = timestamp_spans[0]
-        timestamp_text = timestamp_span.text.strip()
-        
-        date_match = re.search(r"(\d{1,2})-(\w+)-(\d{2})", timestamp_text) or re.search(r"(\d{1,2})/(\d{2})/(\d{4})", timestamp_text)
-        if date_match:
-            day = date_match.group(1)
-            month = date_match.group(2)
-            short_year = date_match.group(3)
+            future = executor.submit(parse_byte_range, input_file, start, end, engine, checkpoints_enabled, partition_key,
+                                     parser_backend, channel, media_store, message_index is not None)
+            pending[future] = (sequence, (start, end, channel))
+        
+        while pending:
+            collect(ALL_COMPLETED)
+
+def start_output(output_dir, queue_size=DEFAULT_QUEUE_SIZE, queue_bytes_limit=None,
+                 write_buffer_mb=DEFAULT_WRITE_BUFFER_MB, fsync="none", key_function=by_year,
+                 open_files_limit=DEFAULT_MAX_OPEN_FILES, compression=None, index=False, backend="auto",
+                 shared_assets=False, shared_media=False):
+    """Resets the output state before a run and starts the writer threads.
+    
+    Each writer keeps at least one file open, so open_files_limit must be at
+    least WRITER_THREADS.
+    """
+    global output_directory, partition_key, max_open_files, write_buffer_size, fsync_policy, output_compression
+    global message_index, parser_backend, asset_store, media_store
+    global queued_bytes, queued_bytes_limit, next_sequence, manifest, checkpoints_enabled
+    
+    if open_files_limit < WRITER_THREADS:
+        raise ValueError(f"The limit of open files must be at least the {WRITER_THREADS} writer threads")
+    
+    with queue_lock:
+        writer_queues[:] = [queue.Queue(maxsize=queue_size) for _ in range(WRITER_THREADS)]
+        writer_errors.clear()
+        partition_writers.clear()
+        channel_headers.clear()
+        output_headers.clear()
+        output_directory = output_dir
+        partition_key = key_function
+        max_open_files = open_files_limit
+        write_buffer_size = int(write_buffer_mb * 1024 * 1024)
+        fsync_policy = fsync
+        output_compression = compression
+        message_index = IndexWriter(output_dir) if index else None
+        parser_backend = resolve_backend(backend)
+        store = AssetStore(os.path.join(output_dir, ASSET_DIR)) if shared_assets or shared_media else None
+        asset_store = store if shared_assets else None
+        media_store = store if shared_media else None
+    
+    with queued_bytes_cond:
+        queued_bytes = 0
+        queued_bytes_limit = queue_bytes_limit
+    
+    with reorder_cond:
+        reorder_buffer.clear()
+        next_sequence = 0
+    
+    with manifest_lock:
+        manifest = None
+        pending_checkpoints.clear()
+        resume_offsets.clear()
+        checkpoints_enabled = False
+    
+    writer_threads[:] = [
+        threading.Thread(target=partition_file_writer, args=(index,), daemon=True)
+        for index in range(WRITER_THREADS)
+    ]
+    for thread in writer_threads:
+        thread.start()
+
+def get_writer_queues(keys):
+    """Returns the queue of the writer that owns each partition, assigning one the first time a partition is seen"""
+    wait_start = time.perf_counter() if run_metrics.enabled else None
+    with queue_lock:
+        if wait_start is not None:
+            run_metrics.observe("lock_wait_seconds", time.perf_counter() - wait_start, lock="queue_lock")
+        for key in keys:
+            if key not in partition_writers:
+                partition_writers[key] = len(partition_writers) % len(writer_queues)
+        return {key: writer_queues[partition_writers[key]] for key in keys}
+
+def put_messages(key, groups):
+    """Queues a batch of encoded message groups for a partition, blocking while the queue or the memory budget is full"""
+    put_groups_by_key({key: groups})
+
+def put_groups_by_key(groups_by_key, rows_by_key=None):
+    """Queues the message groups of a chunk, one batch per partition.
+    
+    Workers collect a whole chunk before handing it over, so queue_lock and
+    the memory budget are taken once per chunk instead of once per message.
+    The index rows of the groups computed by the workers, if any, are
+    queued with their batch.
+    """
+    global queued_bytes
+    
+    queues_by_key = get_writer_queues(groups_by_key)
+    batch_sizes = {key: sum(len(group) for group in groups) for key, groups in groups_by_key.items()}
+    chunk_size = sum(batch_sizes.values())
+    
+    with queued_bytes_cond:
+        if queued_bytes_limit is not None:
+            # A chunk larger than the whole budget is let through once the queues are empty
+            with run_metrics.timer("wait_seconds", stage="memory_budget"):
+                while queued_bytes > 0 and queued_bytes + chunk_size > queued_bytes_limit:
+                    queued_bytes_cond.wait()
+        queued_bytes += chunk_size
+    
+    with run_metrics.timer("wait_seconds", stage="writer_queue"):
+        for key, groups in groups_by_key.items():
+            queues_by_key[key].put((key, groups, batch_sizes[key], rows_by_key.get(key) if rows_by_key else None))
+
+def release_messages(batch_size):
+    """Returns the memory of a written batch to the budget"""
+    global queued_bytes
+    
+    with queued_bytes_cond:
+        queued_bytes -= batch_size
+        queued_bytes_cond.notify_all()
+
+def sample_queue_depths(metrics):
+    """Samples the depth of every writer queue, the queued bytes and the reorder buffer into metrics"""
+    for index, writer_queue in enumerate(writer_queues):
+        metrics.sample("writer_queue_depth", writer_queue.qsize(), writer=str(index))
+    metrics.sample("queued_bytes", queued_bytes)
+    metrics.sample("reorder_buffer_chunks", len(reorder_buffer))
+
+run_metrics.add_sampler(sample_queue_depths)
+
+def put_ordered_batch(sequence, groups_by_key, chunk=None, rows_by_key=None):
+    """Holds a chunk's message groups until every earlier chunk is queued, then queues them in input order"""
+    global next_sequence
+    
+    wait_start = time.perf_counter() if run_metrics.enabled else None
+    with reorder_cond:
+        if wait_start is not None:
+            run_metrics.observe("lock_wait_seconds", time.perf_counter() - wait_start, lock="reorder_cond")
+        reorder_buffer[sequence] = (groups_by_key, chunk, rows_by_key)
+        while next_sequence in reorder_buffer:
+            ready_groups, ready_chunk, ready_rows = reorder_buffer.pop(next_sequence)
+            put_groups_by_key(ready_groups, ready_rows)
+            if manifest is not None:
+                put_checkpoint(next_sequence, ready_groups, ready_chunk)
+            next_sequence += 1
+        reorder_cond.notify_all()
+
+def wait_for_reorder_window(sequence, window):
+    """Blocks until a chunk with this sequence number fits in the reorder window"""
+    with reorder_cond, run_metrics.timer("wait_seconds", stage="reorder_window"):
+        while sequence - next_sequence >= window:
+            reorder_cond.wait()
+
+def start_manifest(input_file):
+    """Loads the checkpoint manifest of the output folder and prepares to continue from it.
+    
+    Partition files of the previous run are truncated back to the last
+    unchanged chunk when their writer first opens them, and new message
+    groups are appended.
+    
+    Returns:
+        Input offset to continue from, or None if the input is unchanged since a complete run
+    """
+    global manifest, checkpoints_enabled
+    
+    scheme = partition_name(partition_key)
+    previous = load_manifest(output_directory, scheme)
+    verified = count_verified_chunks(input_file, previous) if previous else 0
+    
+    if (previous and previous["complete"] and previous["chunks"] and verified == len(previous["chunks"])
+            and previous["chunks"][-1]["end"] == os.path.getsize(input_file)):
+        return None
+    
+    with manifest_lock:
+        if verified == 0:
+            manifest = new_manifest(input_file, scheme)
+            start_offset = 0
+        else:
+            manifest = truncate_manifest(previous, verified)
+            last_chunk = manifest["chunks"][-1]
+            resume_offsets.update(last_chunk["offsets"])
+            start_offset = last_chunk["end"]
+        checkpoints_enabled = True
+        save_manifest(output_directory, manifest)
+    
+    # Reopen every partition file of the previous run so each gets its footer back
+    for key in list(resume_offsets):
+        put_messages(key, [])
+    
+    return start_offset
+
+def put_checkpoint(sequence, groups_by_key, chunk):
+    """Queues a checkpoint marker behind a chunk's message groups in every writer queue"""
+    global checkpoints_enabled
+    
+    with manifest_lock:
+        if chunk is None:
+            # A chunk failed, so nothing after it may be recorded as written
+            checkpoints_enabled = False
+        if not checkpoints_enabled:
+            return
+        
+        chunk["counts"] = {key: len(groups) for key, groups in groups_by_key.items()}
+        pending_checkpoints[sequence] = {"chunk": chunk, "waiting": set(range(len(writer_queues))), "offsets": {}}
+    
+    for writer_queue in writer_queues:
+        writer_queue.put((CHECKPOINT, sequence, 0, None))
+
+def record_checkpoint(sequence, writer_index, offsets):
+    """Records that a writer's files hold everything up to a chunk, saving the manifest once all writers have"""
+    with manifest_lock:
+        checkpoint = pending_checkpoints[sequence]
+        checkpoint["offsets"].update(offsets)
+        checkpoint["waiting"].discard(writer_index)
+        if checkpoint["waiting"]:
+            return
+        
+        del pending_checkpoints[sequence]
+        chunk = checkpoint["chunk"]
+        chunk["offsets"] = checkpoint["offsets"]
+        manifest["chunks"].append(chunk)
+        for key, count in chunk["counts"].items():
+            manifest["partitions"][key] = manifest["partitions"].get(key, 0) + count
+        save_manifest(output_directory, manifest)
+
+def finish_manifest():
+    """Marks the manifest complete if every chunk and partition file was written"""
+    with manifest_lock:
+        if manifest is None:
+            return
+        manifest["complete"] = checkpoints_enabled and not writer_errors and not pending_checkpoints
+        save_manifest(output_directory, manifest)
+
+def finish_output():
+    """Signals all writers to finish and waits for them"""
+    for writer_queue in writer_queues:
+        writer_queue.put(None)
+    
+    for thread in progress_bar(writer_threads, desc="Saving files"):
+        thread.join()
+    
+    for index, error in writer_errors.items():
+        print(f"Error writing files of writer {index}: {error}")
+    
+    if message_index is not None:
+        message_index.close()
+
+def partition_header(channel=None):
+    """Returns the header of new partition files, of a channel's subfolder in batch mode.
+    
+    With shared assets, the stylesheets and embedded images of the header
+    are stored once in the asset folder of the output and linked from it.
+    """
+    header = output_headers.get(channel)
+    if header is None:
+        header = html_header if channel is None else channel_headers[channel]
+        if asset_store is not None:
+            header = asset_store.extract_header(header, "" if channel is None else "../")
+        header = output_headers[channel] = header.encode('utf-8')
+    return header
+
+class PartitionFiles:
+    """Output files of the partitions written by one thread.
+    
+    At most max_handles files are open at once. The least recently used
+    file is closed when the limit is reached and reopened for append when
+    its partition gets more messages. A partition key (channel, key) is
+    written to the channel's subfolder. Compressed partition files get a new
+    gzip member or zstd frame each time they are reopened. A partition with
+    an offset in resume_offsets continues its file of an earlier run from
+    that offset.
+    
+    header is a function of the channel, None outside batch mode, returning
+    the header bytes of new files.
+    """
+    
+    def __init__(self, directory, header, footer, max_handles=DEFAULT_MAX_OPEN_FILES, compression=None,
+                 buffer_size=-1, resume_offsets=None):
+        self.directory = directory
+        self.header = header
+        self.footer = footer
+        self.max_handles = max(1, max_handles)
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.resume_offsets = resume_offsets if resume_offsets is not None else {}
+        self.suffix = COMPRESSION_SUFFIXES.get(compression, "")
+        self.handles = OrderedDict()
+        self.positions = {}
+        self.relative_paths = {}
+    
+    def open(self, key):
+        """Returns the open file of a partition, opening it for append or creating it with the header"""
+        file = self.handles.get(key)
+        if file is not None:
+            self.handles.move_to_end(key)
+            return file
+        
+        if len(self.handles) >= self.max_handles:
+            _, evicted = self.handles.popitem(last=False)
+            evicted.close()
+            run_metrics.inc("files_evicted")
+        
+        if isinstance(key, tuple):
+            channel, name = key
+            channel_dir = os.path.join(self.directory, channel_dir_name(channel))
+            os.makedirs(channel_dir, exist_ok=True)
+            file_path = os.path.join(channel_dir, partition_file_name(name) + self.suffix)
+        else:
+            channel = None
+            file_path = os.path.join(self.directory, partition_file_name(key) + self.suffix)
+        
+        self.relative_paths[key] = os.path.relpath(file_path, self.directory)
+        resume_offset = self.resume_offsets.get(key)
+        if key in self.positions:
+            file = open_output(file_path, "ab", self.compression, self.buffer_size)
+        elif resume_offset is not None and os.path.exists(file_path):
+            file = open(file_path, "r+b", buffering=self.buffer_size)
+            file.truncate(resume_offset)
+            file.seek(resume_offset)
+            self.positions[key] = resume_offset
+        else:
+            header = self.header(channel) + CHATLOG_START
+            file = open_output(file_path, "wb", self.compression, self.buffer_size)
+            file.write(header)
+            self.positions[key] = len(header)
+        
+        self.handles[key] = file
+        run_metrics.inc("files_opened")
+        return file
+    
+    def write(self, key, groups, batch_size):
+        """Appends encoded message groups of batch_size bytes to a partition's file and returns their offset in it"""
+        file = self.open(key)
+        if self.compression is None:
+            file.writelines(groups)
+        else:
+            # One call compresses the whole batch; the zstd writer has no writelines()
+            file.write(b"".join(groups))
+        offset = self.positions[key]
+        self.positions[key] += batch_size
+        return offset
+    
+    def flush(self, keys=None, fsync=False):
+        """Flushes the open files of some partitions, or of all of them, and fsyncs them if requested"""
+        for key in list(self.handles) if keys is None else keys:
+            file = self.handles[key]
+            file.flush()
+            if fsync:
+                with run_metrics.timer("fsync_seconds"):
+                    os.fsync(file.fileno())
+    
+    def close(self, fsync=False):
+        """Writes the footer to every partition file and closes them, fsyncing them first if requested"""
+        for key in list(self.positions):
+            file = self.open(key)
+            file.write(self.footer)
+            if fsync:
+                self.flush([key], fsync=True)
+            file.close()
+            del self.handles[key]
+    
+    def abort(self):
+        """Closes the open files without writing footers"""
+        for file in self.handles.values():
+            file.close()
+        self.handles.clear()
+
+def partition_file_writer(index):
+    """Writes message batches from one writer queue to the files of the partitions it owns.
+    
+    At most max_open_files files are open across all writers, see
+    PartitionFiles. A partition key (channel, key) is written to the
+    channel's subfolder with that channel's header. With a message index,
+    every written batch is also added to the index.
+    """
+    writer_queue = writer_queues[index]
+    files = PartitionFiles(output_directory, partition_header, html_footer.encode('utf-8'),
+                           max_open_files // len(writer_queues), output_compression, write_buffer_size,
+                           resume_offsets)
+    
+    profile_thread()
+    try:
+        while True:
+            batch = writer_queue.get()
+            if batch is None:
+                break
             
-            if len(short_year) == 2:
-                year_prefix = "20" if int(short_year) < 50 else "19"
-                year = year_prefix + short_year
-            else:
-                year = short_year
+            key, groups, batch_size, rows = batch
+            if key is CHECKPOINT:
+                files.flush(fsync=fsync_policy != "none")
+                record_checkpoint(groups, index, files.positions)
+                continue
             
+            write_start = time.perf_counter()
+            offset = files.write(key, groups, batch_size)
+            if message_index is not None:
+                message_index.add_batch(files.relative_paths[key], offset, groups, rows)
+            if fsync_policy == "batch":
+                files.flush([key], fsync=True)
+            release_messages(batch_size)
             
-            group_str = str(group)
+            if run_metrics.enabled:
+                run_metrics.observe("stage_seconds", time.perf_counter() - write_start, stage="write")
+                run_metrics.inc("written_bytes", batch_size, writer=str(index))
+                run_metrics.inc("written_groups", len(groups), writer=str(index))
+        
+        files.close(fsync=fsync_policy in ("batch", "close"))
+    except Exception as e:
+        writer_errors[index] = e
+        files.abort()
+        # Keep draining so producers blocked on this queue are not stuck
+        while True:
+            batch = writer_queue.get()
+            if batch is None:
+                break
+            release_messages(batch[2])
+
+def process_byte_range(file, start, end, size, sequence=None):
+    """Reads the message groups that start in a byte range of the shared file, parses them with the parser backend and processes them"""
+    profile_thread()
+    try:
+        with run_metrics.timer("stage_seconds", stage="read"):
+            group_start, group_end, data = read_message_range(file, start, end, size)
+            chunk = {"start": group_start, "end": group_end, "hash": hash_chunk(data)} if checkpoints_enabled else None
+            content = data.decode('utf-8', errors='replace')
+            run_metrics.inc("input_bytes", len(data))
+        
+        with run_metrics.timer("stage_seconds", stage="parse"):
+            message_groups = parser_backend.parse(content) if content else []
+    except Exception:
+        if sequence is not None:
+            put_ordered_batch(sequence, {})
+        raise
+    
+    process_messages_batch(message_groups, sequence, chunk)
+
+def process_messages_batch(message_groups, sequence=None, chunk=None):
+    """Processes a batch of message groups parsed by the parser backend.
+    
+    Message groups are collected by partition in a dictionary local to the
+    worker and handed to the writers once, when the chunk is done. With a
+    sequence number the batch is queued in input order after all earlier
+    chunks, otherwise as soon as it is classified.
+    """
+    rows_by_key = {} if message_index is not None else None
+    with_author = needs_author(partition_key) or rows_by_key is not None
+    groups_by_key = {}
+    classify_start = time.perf_counter()
+    
+    try:
+        for group in message_groups:
+            info = parser_backend.classify(group, with_author)
+            if info is None:
+                continue
             
-            with queue_lock:
-                if year not in year_queues:
-                    year_queues[year] = queue.Queue()
-                year_queues[year].put(group_str)
+            key = partition_key(info)
+            group_html = parser_backend.serialize(group)
+            groups_by_key.setdefault(key, []).append(group_html.encode('utf-8'))
+            if rows_by_key is not None:
+                rows_by_key.setdefault(key, []).append(index_row(info, parse_message_timestamp(group_html)))
+        
+        if media_store is not None:
+            store_group_media(groups_by_key, media_store)
+    except Exception:
+        chunk = None
+        raise
+    finally:
+        if run_metrics.enabled:
+            run_metrics.observe("stage_seconds", time.perf_counter() - classify_start, stage="classify")
+            run_metrics.inc("chunks")
+            run_metrics.inc("message_groups", len(message_groups))
+        if sequence is not None:
+            put_ordered_batch(sequence, groups_by_key, chunk, rows_by_key)
         else:
-            pass
+            put_groups_by_key(groups_by_key, rows_by_key)
 
 if __name__ == "__main__":
     from dsparser.cli import main
-    main() 
\ No newline at end of file
+    main()
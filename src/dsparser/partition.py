@@ -0,0 +1,121 @@
+"""
+Partitioning schemes that decide which output file a message group goes to.
+
+A partition key function takes a MessageInfo and returns the key of the
+output file, which is saved as "{key}.html" in the output folder.
+"""
+
+import datetime
+import importlib
+import re
+from collections import namedtuple
+
+from dsparser.utils.html_helpers import parse_message_author
+from dsparser.utils.timestamps import timestamp_classifier
+
+
+MessageInfo = namedtuple("MessageInfo", ["year", "month", "day", "author"])
+
+
+def parse_message_info(message_html, with_author=False):
+    """Extracts the MessageInfo of a message group from its HTML, or None if it has no date"""
+    date_parts = timestamp_classifier.classify_html(message_html)
+    if date_parts is None:
+        return None
+    author = parse_message_author(message_html) if with_author else None
+    return MessageInfo(*date_parts, author)
+
+
+def by_year(info):
+    """Partitions messages by year, e.g. 2021"""
+    return info.year
+
+
+def by_month(info):
+    """Partitions messages by year and month, e.g. 2021-03"""
+    if info.month is None:
+        return info.year
+    return f"{info.year}-{info.month:02d}"
+
+
+def by_week(info):
+    """Partitions messages by ISO week, e.g. 2021-W09"""
+    if info.month is None or info.day is None:
+        return info.year
+    try:
+        iso_year, iso_week, _ = datetime.date(int(info.year), info.month, info.day).isocalendar()
+    except ValueError:
+        return info.year
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def by_author(info):
+    """Partitions messages by author"""
+    return info.author or "unknown"
+
+
+PARTITION_SCHEMES = {
+    "year": by_year,
+    "month": by_month,
+    "week": by_week,
+    "author": by_author,
+}
+
+# Schemes that only look at the date, so the author does not need to be extracted
+DATE_ONLY_SCHEMES = (by_year, by_month, by_week)
+
+
+def resolve_partition(partition):
+    """
+    Resolves a partitioning scheme to its key function.
+    
+    Args:
+        partition: Scheme name ("year", "month", "week", "author"),
+            a "module:function" reference or a callable
+    
+    Returns:
+        Key function taking a MessageInfo
+    
+    Raises:
+        ValueError: If the scheme is not recognized
+    """
+    if callable(partition):
+        return partition
+    if partition in PARTITION_SCHEMES:
+        return PARTITION_SCHEMES[partition]
+    if ":" in partition:
+        module_name, function_name = partition.split(":", 1)
+        return getattr(importlib.import_module(module_name), function_name)
+    raise ValueError(f"Unknown partitioning scheme: {partition}")
+
+
+def partition_name(partition_key):
+    """Returns a stable name of a key function, used to tell runs with different schemes apart"""
+    for name, function in PARTITION_SCHEMES.items():
+        if function is partition_key:
+            return name
+    return f"{partition_key.__module__}:{partition_key.__qualname__}"
+
+
+def needs_author(partition_key):
+    """Returns True if the key function may use the author of a message"""
+    return partition_key not in DATE_ONLY_SCHEMES
+
+
+def partition_file_name(key):
+    """Returns a safe output file name for a partition key.
+    
+    Keys with characters that are not safe in file names are sanitized and
+    get a short hash suffix, so different keys never share a file.
+    """
+    key = str(key)
+    safe_key = re.sub(r'[^\w-]', '_', key)
+    if safe_key != key:
+        import hashlib
+        safe_key += "-" + hashlib.blake2b(key.encode('utf-8'), digest_size=4).hexdigest()
+    return safe_key + ".html"
+
+
+def channel_dir_name(channel):
+    """Returns a safe output folder name for a channel"""
+    return partition_file_name(channel)[:-len(".html")]
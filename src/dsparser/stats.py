@@ -0,0 +1,224 @@
+"""
+Statistics mode: counts message groups, messages and bytes by year, month
+and author without serializing message groups or writing partition files.
+
+Workers classify the message groups of their byte ranges like the scan
+engine does and return small counters, which are merged as they finish,
+so memory stays at a few chunks in flight however large the input is.
+"""
+
+import csv
+import json
+import os
+from collections import Counter
+
+from dsparser import parser
+from dsparser.backends import resolve_backend
+from dsparser.batch import find_input_files
+from dsparser.metrics import profile_thread
+from dsparser.partition import MessageInfo, parse_message_info, by_month
+from dsparser.utils.compression import detect_compression, iter_decompressed_blocks
+from dsparser.utils.reader import read_message_range, iter_stream_chunks
+from dsparser.utils.scanner import GROUP_MARKER, iter_group_spans
+from dsparser.utils.timestamps import timestamp_classifier
+
+
+MESSAGE_MARKER = b'data-message-id="'
+COUNTS = ("groups", "messages", "bytes")
+CSV_COLUMNS = ["year", "month", "author", "groups", "messages", "bytes"]
+
+
+class MessageStats:
+    """
+    Counts of message groups, messages and HTML bytes by (year, month, author).
+    
+    Totals by year, month or author are sums over these keys, so stats of
+    different chunks and workers merge by adding them up.
+    """
+    
+    def __init__(self):
+        self.counts = {name: Counter() for name in COUNTS}
+    
+    def add(self, info, messages, size):
+        """Counts a message group with its MessageInfo, number of messages and size in bytes"""
+        key = (info.year, info.month, info.author)
+        self.counts["groups"][key] += 1
+        self.counts["messages"][key] += messages
+        self.counts["bytes"][key] += size
+    
+    def update(self, other):
+        """Adds the counts of another MessageStats"""
+        for name in COUNTS:
+            self.counts[name].update(other.counts[name])
+    
+    def rows(self):
+        """Returns one dictionary per (year, month, author) with its counts, sorted by key"""
+        rows = []
+        for key in sorted(self.counts["groups"], key=lambda key: (key[0], key[1] or 0, key[2] or "")):
+            year, month, author = key
+            rows.append(dict(year=year, month=month, author=author, **{name: self.counts[name][key] for name in COUNTS}))
+        return rows
+    
+    def totals(self, key_function=None):
+        """
+        Sums the counts by a key of the rows.
+        
+        Args:
+            key_function: Function of (year, month, author) returning the key to
+                sum by, or None for the grand total
+        
+        Returns:
+            Dictionary of the counts by key, or the counts for the grand total
+        """
+        totals = {}
+        for key in self.counts["groups"]:
+            total = totals.setdefault(key_function(*key) if key_function else None, dict.fromkeys(COUNTS, 0))
+            for name in COUNTS:
+                total[name] += self.counts[name][key]
+        if key_function is None:
+            return totals.get(None, dict.fromkeys(COUNTS, 0))
+        return dict(sorted(totals.items()))
+    
+    def to_dict(self):
+        """Returns the totals overall and by year, month and author as a JSON-serializable dictionary"""
+        return {
+            "total": self.totals(),
+            "years": self.totals(lambda year, month, author: year),
+            "months": self.totals(lambda year, month, author: by_month(MessageInfo(year, month, None, None))),
+            "authors": self.totals(lambda year, month, author: author or ""),
+        }
+
+
+def iter_group_bounds(data):
+    """
+    Yields (start, end) of the message groups in raw bytes, taking each group to end at the last tag before the next one.
+    
+    Unlike iter_group_spans() this does not follow the div nesting, which
+    is most of the cost of scanning, so markup between two groups counts
+    towards the first. Only the last group is scanned to its closing tag.
+    
+    Raises:
+        ValueError: If the last message group is not closed before the end
+            of data, with its offset in args[1]
+    """
+    start = data.find(GROUP_MARKER)
+    while start != -1:
+        next_start = data.find(GROUP_MARKER, start + len(GROUP_MARKER))
+        if next_start == -1:
+            yield next(iter_group_spans(data, start))
+            return
+        yield start, data.rfind(b'>', start, next_start) + 1
+        start = next_start
+
+
+def count_groups(data, backend="auto"):
+    """
+    Counts the message groups in raw bytes without serializing them.
+    
+    Falls back to the parser backend for the remainder of the data if the
+    last group is not closed, like the scan engine.
+    
+    Returns:
+        MessageStats of the data
+    """
+    profile_thread()
+    stats = MessageStats()
+    try:
+        for start, end in iter_group_bounds(data):
+            group_bytes = data[start:end]
+            info = parse_message_info(group_bytes.decode('utf-8', errors='replace'), with_author=True)
+            if info is not None:
+                stats.add(info, max(1, group_bytes.count(MESSAGE_MARKER)), len(group_bytes))
+    except ValueError as e:
+        backend = resolve_backend(backend)
+        for group in backend.parse(data[e.args[1]:].decode('utf-8', errors='replace')):
+            info = backend.classify(group, with_author=True)
+            if info is not None:
+                group_bytes = backend.serialize(group).encode('utf-8')
+                stats.add(info, max(1, group_bytes.count(MESSAGE_MARKER)), len(group_bytes))
+    return stats
+
+
+def count_byte_range(input_file, start, end, backend="auto"):
+    """Counts the message groups that start in a byte range of the file, see count_groups()"""
+    with open(input_file, 'rb') as file:
+        _, _, data = read_message_range(file, start, end, os.fstat(file.fileno()).st_size)
+    return count_groups(data, backend)
+
+
+def write_stats(stats, stats_out):
+    """Writes stats to a file, as CSV rows by year, month and author if it ends with .csv and as JSON totals otherwise"""
+    if stats_out.endswith(".csv"):
+        with open(stats_out, 'w', encoding='utf-8', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+            writer.writeheader()
+            writer.writerows(stats.rows())
+    else:
+        with open(stats_out, 'w', encoding='utf-8') as file:
+            json.dump(stats.to_dict(), file, indent=2, ensure_ascii=False)
+
+
+def parse_discord_html_stats(inputs, stats_out=None, workers=4, chunk_size_mb=10, mode="threads", backend="auto"):
+    """
+    Counts the message groups, messages and bytes of exports by year, month and author.
+    
+    No message group is serialized and no output file is written besides
+    stats_out. Compressed exports are decompressed as a stream.
+    
+    Args:
+        inputs: Path of an export, or a list of file paths, directories and glob patterns
+        stats_out: File for the statistics, see write_stats(). None to only return them
+        workers: Number of worker threads or processes
+        chunk_size_mb: Size of the byte ranges counted by each task in MB
+        mode: Execution mode, "threads" or "processes"
+        backend: Parser backend for malformed message groups
+    
+    Returns:
+        MessageStats of all exports
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
+    
+    files = find_input_files([inputs] if isinstance(inputs, str) else inputs)
+    stats = MessageStats()
+    chunk_size = chunk_size_mb * 1024 * 1024
+    max_pending = workers * 2
+    backend = resolve_backend(backend)
+    
+    # The decompressed size of compressed files is not known up front
+    streamed = [path for path in files if detect_compression(path) is not None]
+    total_size = None if streamed else sum(os.path.getsize(path) for path in files)
+    
+    with parser.worker_pool(workers, mode) as executor, parser.progress_bar(total=total_size, unit='B', unit_scale=True, desc='Counting messages') as pbar:
+        pending = {}
+        
+        def collect(return_when):
+            done, _ = wait(pending, return_when=return_when)
+            for future in done:
+                pbar.update(pending.pop(future))
+                try:
+                    stats.update(future.result())
+                except Exception as e:
+                    print(f"Error counting messages: {e}")
+        
+        def submit(size, function, *args):
+            if len(pending) >= max_pending:
+                collect(FIRST_COMPLETED)
+            pending[executor.submit(function, *args)] = size
+        
+        for input_file in files:
+            timestamp_classifier.detect(parser.read_html_start(input_file))
+            if input_file in streamed:
+                for _, data in iter_stream_chunks(iter_decompressed_blocks(input_file, workers), chunk_size):
+                    submit(len(data), count_groups, data, backend)
+            else:
+                for start, end in parser.split_byte_ranges(input_file, chunk_size):
+                    submit(end - start, count_byte_range, input_file, start, end, backend)
+        
+        while pending:
+            collect(ALL_COMPLETED)
+    
+    if stats_out:
+        write_stats(stats, stats_out)
+    total = stats.totals()
+    print(f"Counted {total['messages']:,} messages in {total['groups']:,} message groups ({total['bytes']:,} bytes)")
+    return stats
@@ -0,0 +1,95 @@
+"""
+Streaming API that yields parsed message groups instead of writing files.
+
+Unlike parse_discord_html, these functions keep no module state: every call
+works on its own file handle, so they can be used from several threads at
+once. The input is memory-mapped and scanned in place, so memory use does
+not grow with the file size.
+"""
+
+import mmap
+import os
+from collections import namedtuple
+from typing import Iterator
+
+from dsparser.partition import parse_message_info
+from dsparser.utils.html_helpers import parse_message_timestamp
+from dsparser.utils.scanner import GROUP_MARKER, iter_group_spans
+
+
+MessageRecord = namedtuple("MessageRecord", ["start", "end", "timestamp", "year", "month", "day", "author", "html"])
+MessageRecord.__doc__ = """A message group of an export.
+
+start and end are byte offsets of the group in the input and html is the
+raw bytes between them. The date fields are None when the group has no
+recognizable date.
+"""
+
+
+def iter_message_spans(data, start=0):
+    """
+    Yields the byte spans of message groups, skipping past malformed ones.
+    
+    A group that is not closed before the end of data runs up to the next
+    group marker, and scanning continues from there.
+    
+    Args:
+        data: Bytes-like HTML content, for example a memory-mapped file
+        start: Offset to start scanning from
+    
+    Yields:
+        Tuple (start, end) of each message group
+    """
+    size = len(data)
+    while True:
+        try:
+            for span in iter_group_spans(data, start):
+                yield span
+            return
+        except ValueError as e:
+            group_start = e.args[1]
+            start = data.find(GROUP_MARKER, group_start + len(GROUP_MARKER))
+            if start == -1:
+                start = size
+            yield group_start, start
+            if start == size:
+                return
+
+
+def iter_message_records(data, offset=0, with_author=True) -> Iterator[MessageRecord]:
+    """
+    Yields a MessageRecord for every message group in a buffer.
+    
+    Args:
+        data: Bytes-like HTML content
+        offset: Input offset of data, added to the record offsets
+        with_author: Whether to extract the author of each group
+    
+    Yields:
+        MessageRecord of each message group in input order
+    """
+    for start, end in iter_message_spans(data):
+        group_bytes = data[start:end]
+        group_html = group_bytes.decode('utf-8', errors='replace')
+        info = parse_message_info(group_html, with_author)
+        year, month, day, author = info if info is not None else (None, None, None, None)
+        yield MessageRecord(offset + start, offset + end, parse_message_timestamp(group_html),
+                            year, month, day, author, group_bytes)
+
+
+def iter_messages(input_file, with_author=True) -> Iterator[MessageRecord]:
+    """
+    Yields a MessageRecord for every message group of a Discord HTML export.
+    
+    Args:
+        input_file: Path to input HTML file
+        with_author: Whether to extract the author of each group
+    
+    Yields:
+        MessageRecord of each message group in input order
+    """
+    if os.path.getsize(input_file) == 0:
+        return
+    
+    with open(input_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield from iter_message_records(mapped, 0, with_author)
@@ -0,0 +1,210 @@
+"""
+Automatic tuning: picks the worker count, chunk size and engine of a run
+from a quick calibration pass over a sample of the real input and the
+cores and memory actually available.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+from dsparser.parser import parse_chunk_bytes, read_html_start, new_worker_pool, PARSE_MEMORY_FACTOR
+from dsparser.backends import resolve_backend
+from dsparser.partition import by_year
+from dsparser.utils.compression import detect_compression, iter_decompressed_blocks
+from dsparser.utils.reader import read_message_range, iter_stream_chunks
+from dsparser.utils.timestamps import timestamp_classifier
+
+
+SAMPLE_PIECE_SIZE = 256 * 1024
+MIN_SAMPLE_PIECES = 8
+MAX_SAMPLE_PIECES = 32
+# Engines are compared on the first pieces only, the worker counts on all of them
+ENGINE_SAMPLE_PIECES = 2
+ENGINES = ["scan", "soup"]
+
+# More workers are only used when they are at least this much faster
+MIN_SPEEDUP = 1.1
+CHUNKS_PER_WORKER = 4
+MAX_CHUNK_SIZE_MB = 64
+# Share of the available memory a tuned run may plan to use
+MEMORY_SHARE = 0.5
+
+Calibration = namedtuple("Calibration", ["workers", "chunk_size_mb", "engine", "throughput", "memory_factor"])
+
+
+def available_cpus():
+    """Returns the number of CPUs this process may run on"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def available_memory_bytes():
+    """Returns the memory available to new allocations, or None where it is not known"""
+    try:
+        with open("/proc/meminfo") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def read_sample(input_file, pieces, piece_size=SAMPLE_PIECE_SIZE):
+    """
+    Reads pieces of whole message groups from across the input.
+    
+    Pieces of uncompressed files are spread evenly over the file, so the
+    sample covers old and new messages alike. Compressed files can only be
+    read from the start, so their pieces follow each other.
+    
+    Args:
+        input_file: Path to the export
+        pieces: Number of pieces
+        piece_size: Approximate size of each piece in bytes
+    
+    Returns:
+        List of the non-empty pieces as bytes
+    """
+    if detect_compression(input_file) is not None:
+        sample = []
+        blocks = iter_decompressed_blocks(input_file, 1)
+        try:
+            for _, data in iter_stream_chunks(blocks, piece_size):
+                sample.append(data)
+                if len(sample) >= pieces:
+                    break
+        finally:
+            blocks.close()
+        return sample
+    
+    size = os.path.getsize(input_file)
+    step = max(size // pieces, piece_size)
+    sample = []
+    with open(input_file, 'rb') as file:
+        for start in range(0, size, step):
+            _, _, data = read_message_range(file, start, min(start + piece_size, size), size)
+            if data:
+                sample.append(data)
+    return sample[:pieces]
+
+
+def parse_sample(executor, sample, engine, backend):
+    """Parses the pieces of a sample on an executor and returns the seconds it took"""
+    start = time.perf_counter()
+    for future in [executor.submit(parse_chunk_bytes, data, engine, by_year, backend) for data in sample]:
+        future.result()
+    return time.perf_counter() - start
+
+
+def measure_memory_factor(data, engine, backend):
+    """Returns the peak memory of parsing a piece, including the piece itself, relative to its size"""
+    import tracemalloc
+    
+    if tracemalloc.is_tracing():
+        # Already traced for the run's metrics; the peak would include everything else
+        return PARSE_MEMORY_FACTOR
+    tracemalloc.start()
+    try:
+        parse_chunk_bytes(data, engine, by_year, backend)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return 1 + peak / len(data)
+
+
+def worker_candidates(cpus):
+    """Returns the worker counts to try: powers of two below the number of CPUs, and the number of CPUs"""
+    candidates = {cpus}
+    workers = 1
+    while workers < cpus:
+        candidates.add(workers)
+        workers *= 2
+    return sorted(candidates)
+
+
+def calibrate(input_file, mode="threads", engine=None, backend="auto", memory_budget_mb=None):
+    """
+    Measures a sample of the input and picks the settings of the run.
+    
+    The engines are timed on a few pieces of the sample, and the fastest
+    one is then run on the whole sample with an increasing number of
+    workers. The most workers that still give a clear speedup are used.
+    The chunk size gives every worker several chunks, and is limited so
+    that the chunks in flight, at the memory measured per chunk byte, fit
+    in half of the available memory or of the memory budget.
+    
+    Args:
+        input_file: Path to the export, which may be compressed
+        mode: Execution mode of the run, "threads" or "processes"
+        engine: Engine to use, or None to pick the faster of "scan" and "soup"
+        backend: Parser backend of the soup engine
+        memory_budget_mb: Memory budget of the run in MB, or None to use the available memory
+    
+    Returns:
+        Calibration with the chosen workers, chunk_size_mb and engine, the
+        measured throughput in bytes per second and the memory factor
+    """
+    cpus = available_cpus()
+    backend = resolve_backend(backend)
+    timestamp_classifier.detect(read_html_start(input_file))
+    
+    sample = read_sample(input_file, min(max(MIN_SAMPLE_PIECES, cpus * 2), MAX_SAMPLE_PIECES))
+    if not sample:
+        print("Auto-tuning: no message groups found in the sample, using 1 worker")
+        return Calibration(1, 1, engine or "soup", 0.0, float(PARSE_MEMORY_FACTOR))
+    sample_size = sum(len(data) for data in sample)
+    
+    engine_seconds = {}
+    with new_worker_pool(1) as executor:
+        for candidate in [engine] if engine else ENGINES:
+            # The first piece also warms up imports and caches
+            parse_sample(executor, sample[:1], candidate, backend)
+            engine_seconds[candidate] = parse_sample(executor, sample[:ENGINE_SAMPLE_PIECES], candidate, backend)
+    engine = min(engine_seconds, key=engine_seconds.get)
+    memory_factor = measure_memory_factor(max(sample, key=len), engine, backend)
+    
+    throughputs = {}
+    for workers in worker_candidates(cpus):
+        with new_worker_pool(workers, mode) as executor:
+            parse_sample(executor, sample[:workers], engine, backend)
+            throughputs[workers] = sample_size / max(parse_sample(executor, sample, engine, backend), 1e-9)
+    
+    best_workers = 1
+    for workers, throughput in sorted(throughputs.items()):
+        if throughput >= throughputs[best_workers] * MIN_SPEEDUP:
+            best_workers = workers
+    
+    if memory_budget_mb:
+        memory_limit = memory_budget_mb * 1024 * 1024
+    else:
+        available_memory = available_memory_bytes()
+        memory_limit = available_memory * MEMORY_SHARE if available_memory else None
+    
+    chunk_size = os.path.getsize(input_file) / (best_workers * CHUNKS_PER_WORKER)
+    if memory_limit:
+        # Half for the chunks in flight, workers * 2 of them, like split_memory_budget()
+        chunk_size = min(chunk_size, memory_limit / 2 / (best_workers * 2 * memory_factor))
+    chunk_size_mb = int(max(1, min(chunk_size / (1024 * 1024), MAX_CHUNK_SIZE_MB)))
+    
+    calibration = Calibration(best_workers, chunk_size_mb, engine, throughputs[best_workers], memory_factor)
+    print(
+        f"Auto-tuning: {cpus} CPUs, "
+        + (f"{memory_limit / 1024 ** 3:.1f} GB memory for the run, " if memory_limit else "")
+        + f"{len(sample)} sample pieces ({sample_size / 1024 ** 2:.1f} MB)"
+    )
+    print("Auto-tuning: engine " + ", ".join(
+        f"{name} {sample_seconds:.2f}s" for name, sample_seconds in engine_seconds.items()
+    ) + "; workers " + ", ".join(
+        f"{workers} {throughput / 1024 ** 2:.1f} MB/s" for workers, throughput in throughputs.items()
+    ))
+    print(
+        f"Auto-tuning: using --engine {engine} --workers {best_workers} --chunk-size {chunk_size_mb} "
+        f"(parsing takes about {memory_factor:.0f}x the chunk size in memory)"
+    )
+    return calibration
@@ -0,0 +1,198 @@
+"""
+Streaming gzip and zstd support for input and output files.
+
+Compressed inputs are recognized by their magic bytes. zstd support needs
+the optional zstandard package. gzip and zstandard are imported when a
+compressed file is first opened, so uncompressed runs do not load them.
+"""
+
+import struct
+from collections import deque
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+ZSTD_SKIPPABLE_MAGIC = 0x184D2A50  # low 4 bits are free
+
+COMPRESSION_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+READ_SIZE = 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def require_zstandard():
+    """Imports zstandard on first use, raising an error with a hint if it is not installed"""
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd support needs the zstandard package: pip install zstandard") from None
+    return zstandard
+
+
+def detect_compression(input_file: str) -> Optional[str]:
+    """
+    Detects the compression of a file from its magic bytes.
+    
+    Args:
+        input_file: Path to the file
+    
+    Returns:
+        "gzip", "zstd" or None for uncompressed files
+    """
+    with open(input_file, 'rb') as file:
+        magic = file.read(4)
+    
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return None
+
+
+def open_input(input_file: str, compression: Optional[str] = None) -> BinaryIO:
+    """
+    Opens a file for reading, decompressing it on the fly.
+    
+    Args:
+        input_file: Path to the file
+        compression: "gzip", "zstd" or None; detected from the file if None
+    
+    Returns:
+        Binary file object with the decompressed content
+    """
+    compression = compression or detect_compression(input_file)
+    if compression == "gzip":
+        import gzip
+        return gzip.open(input_file, 'rb')
+    if compression == "zstd":
+        zstandard = require_zstandard()
+        return zstandard.ZstdDecompressor().stream_reader(open(input_file, 'rb'), read_across_frames=True)
+    return open(input_file, 'rb')
+
+
+def open_output(file_path: str, mode: str, compression: Optional[str] = None, buffering: int = -1) -> BinaryIO:
+    """
+    Opens an output file for writing or appending, compressing on the fly.
+    
+    Appending to a compressed file adds a new gzip member or zstd frame,
+    which decompress as one stream.
+    
+    Args:
+        file_path: Path to the file, including its compression suffix
+        mode: "wb" or "ab"
+        compression: "gzip", "zstd" or None
+        buffering: Buffer size of the underlying file, unused for gzip
+    
+    Returns:
+        Binary file object. Compressed files only support write(), not writelines().
+    """
+    if compression == "gzip":
+        import gzip
+        return gzip.open(file_path, mode, compresslevel=GZIP_LEVEL)
+    if compression == "zstd":
+        zstandard = require_zstandard()
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(file_path, mode, buffering=buffering))
+    return open(file_path, mode, buffering=buffering)
+
+
+def iter_zstd_frame_spans(file: BinaryIO) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the byte spans of the zstd frames of a file, skipping skippable frames.
+    
+    Only frame and block headers are read, so this is cheap even for large files.
+    
+    Raises:
+        ValueError: If the file is not a valid sequence of zstd frames
+    """
+    offset = 0
+    while True:
+        file.seek(offset)
+        magic = file.read(4)
+        if not magic:
+            return
+        if len(magic) < 4:
+            raise ValueError("Truncated zstd frame", offset)
+        
+        magic_number = struct.unpack('<I', magic)[0]
+        if magic_number & 0xFFFFFFF0 == ZSTD_SKIPPABLE_MAGIC:
+            offset += 8 + struct.unpack('<I', file.read(4))[0]
+            continue
+        if magic != ZSTD_MAGIC:
+            raise ValueError("Not a zstd frame", offset)
+        
+        descriptor = file.read(1)[0]
+        content_size_flag = descriptor >> 6
+        single_segment = descriptor >> 5 & 1
+        has_checksum = descriptor >> 2 & 1
+        dictionary_id_size = (0, 1, 2, 4)[descriptor & 3]
+        content_size_size = (single_segment, 2, 4, 8)[content_size_flag]
+        
+        position = offset + 5 + (not single_segment) + dictionary_id_size + content_size_size
+        while True:
+            file.seek(position)
+            block_header = file.read(3)
+            if len(block_header) < 3:
+                raise ValueError("Truncated zstd frame", offset)
+            header = int.from_bytes(block_header, 'little')
+            block_type = header >> 1 & 3
+            block_size = header >> 3
+            if block_type == 3:
+                raise ValueError("Invalid zstd block", position)
+            position += 3 + (1 if block_type == 1 else block_size)
+            if header & 1:
+                break
+        
+        end = position + 4 * has_checksum
+        yield offset, end
+        offset = end
+
+
+def decompress_zstd_frame(frame: bytes) -> bytes:
+    """Decompresses a single zstd frame"""
+    return require_zstandard().ZstdDecompressor().decompressobj().decompress(frame)
+
+
+def iter_decompressed_blocks(input_file: str, workers: int = 4) -> Iterator[bytes]:
+    """
+    Yields the decompressed content of a file in blocks.
+    
+    zstd files made of several frames are decompressed frame by frame on a
+    thread pool, with at most workers * 2 frames in flight. Other files are
+    read sequentially.
+    
+    Args:
+        input_file: Path to the file
+        workers: Number of threads for decompressing zstd frames
+    """
+    compression = detect_compression(input_file)
+    
+    if compression == "zstd":
+        require_zstandard()
+        with open(input_file, 'rb') as file:
+            spans = list(iter_zstd_frame_spans(file))
+        
+        if len(spans) > 1 and workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with open(input_file, 'rb') as file, ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = deque()
+                for start, end in spans:
+                    if len(pending) >= workers * 2:
+                        yield pending.popleft().result()
+                    file.seek(start)
+                    # zstandard releases the GIL while decompressing
+                    pending.append(executor.submit(decompress_zstd_frame, file.read(end - start)))
+                while pending:
+                    yield pending.popleft().result()
+            return
+    
+    with open_input(input_file, compression) as file:
+        while True:
+            block = file.read(READ_SIZE)
+            if not block:
+                return
+            yield block
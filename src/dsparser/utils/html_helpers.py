@@ -2,6 +2,7 @@
 Helper functions for working with Discord HTML files.
 """
 
+import html
 import re
 from typing import Tuple, Optional
 
@@ -28,55 +29,119 @@ def extract_html_header_footer(content: str) -> Tuple[str, str]:
     return header, footer
 
 
-def parse_message_date(message_html: str) -> Optional[str]:
+MONTHS = {
+    name: number
+    for number, names in enumerate([
+        ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+        ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+        ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"), ("dec", "december"),
+    ], start=1)
+    for name in names
+}
+
+
+def expand_short_year(short_year: str) -> str:
     """
-    Extracts the year from Discord message HTML.
+    Expands a two-digit year the way Discord exports abbreviate it.
+    
+    Args:
+        short_year: Two-digit year
+        
+    Returns:
+        Four-digit year string
+    """
+    year_prefix = "20" if int(short_year) < 50 else "19"
+    return year_prefix + short_year
+
+
+def month_number(month: str) -> Optional[int]:
+    """
+    Converts a month name or number to its number.
+    
+    Args:
+        month: Month name, abbreviation or number
+        
+    Returns:
+        Month number from 1 to 12, or None if not recognized
+    """
+    if month.isdigit():
+        number = int(month)
+        return number if 1 <= number <= 12 else None
+    return MONTHS.get(month.lower())
+
+
+def parse_message_date_parts(message_html: str) -> Optional[Tuple[str, Optional[int], Optional[int]]]:
+    """
+    Extracts the date from Discord message HTML.
     
     Args:
         message_html: HTML code of the message
         
     Returns:
-        String with the year or None if year not found
+        Tuple (year, month, day) or None if year not found. Month and day
+        are None when they cannot be recognized.
     """
+    # Imported here because the classifier itself builds on the helpers in this module
+    from dsparser.utils.timestamps import timestamp_classifier
     
-    # First look for timestamp in format <span class="chatlog__timestamp" title="...">
-    timestamp_match = re.search(r'<span class="chatlog__timestamp"[^>]*title="([^"]+)"', message_html)
+    return timestamp_classifier.classify_html(message_html)
+
+
+def parse_message_timestamp(message_html: str) -> Optional[str]:
+    """
+    Extracts the timestamp text of a Discord message group as written in the export.
     
+    Args:
+        message_html: HTML code of the message group
+        
+    Returns:
+        Timestamp string, for example "12-Dec-19 10:00 AM", or None if not found
+    """
+    timestamp_match = re.search(r'<span class="chatlog__timestamp"[^>]*title="([^"]+)"', message_html)
     if timestamp_match:
-        date_string = timestamp_match.group(1)
-        date_match = re.search(r"(\d{1,2}) (\w+) (\d{4})", date_string)
-        if date_match:
-            year = date_match.group(3)
-            return year
+        return html.unescape(timestamp_match.group(1))
     
     message_div_match = re.search(r'title="Message sent:\s*([^"]+)"', message_html)
     if message_div_match:
-        date_string = message_div_match.group(1)
-        date_match = re.search(r"(\d{1,2})-(\w+)-(\d{2})", date_string)
-        if date_match:
-            short_year = date_match.group(3)
-            year_prefix = "20" if int(short_year) < 50 else "19"
-            year = year_prefix + short_year
-            return year
+        return html.unescape(message_div_match.group(1).strip())
     
     content_match = re.search(r'<span class="chatlog__timestamp"[^>]*>([^<]+)</span>', message_html, re.DOTALL)
     if content_match:
-        date_string = content_match.group(1).strip()
-        date_match = re.search(r"(\d{1,2})-(\w+)-(\d{2})", date_string)
-        if date_match:
-            short_year = date_match.group(3)
-            year_prefix = "20" if int(short_year) < 50 else "19"
-            year = year_prefix + short_year
-            return year
+        return html.unescape(content_match.group(1).strip())
+    
+    return None
+
+
+def parse_message_date(message_html: str) -> Optional[str]:
+    """
+    Extracts the year from Discord message HTML.
+    
+    Args:
+        message_html: HTML code of the message
         
-        date_match = re.search(r"(\d{1,2})\s+(\w+)\s+(\d{4})", date_string)
-        if date_match:
-            year = date_match.group(3)
-            return year
+    Returns:
+        String with the year or None if year not found
+    """
+    date_parts = parse_message_date_parts(message_html)
+    return date_parts[0] if date_parts else None
+
+
+def parse_message_author(message_html: str) -> Optional[str]:
+    """
+    Extracts the author of a Discord message group.
+    
+    Args:
+        message_html: HTML code of the message group
         
-        date_match = re.search(r"(\w+)\s+(\d{1,2}),\s+(\d{4})", date_string)
-        if date_match:
-            year = date_match.group(3)
-            return year
+    Returns:
+        Author name (with discriminator when the export has one) or None if not found
+    """
+    author_match = re.search(r'<span class="chatlog__author(?:-name)?"[^>]*title="([^"]+)"', message_html)
+    if author_match:
+        return html.unescape(author_match.group(1))
+    
+    author_match = re.search(r'<span class="chatlog__author(?:-name)?"[^>]*>([^<]+)</span>', message_html)
+    if author_match:
+        return html.unescape(author_match.group(1).strip())
     
-    return None
\ No newline at end of file
+    return None
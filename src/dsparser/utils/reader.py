@@ -0,0 +1,252 @@
+"""
+Input readers for Discord HTML files.
+"""
+
+import os
+import threading
+from typing import BinaryIO, Iterator, List, Tuple
+
+from dsparser.utils.scanner import GROUP_MARKER, CHATLOG_MARKER
+
+
+SCAN_WINDOW = 64 * 1024
+# Smaller ranges would mostly cost realignment reads
+MIN_RANGE_SIZE = SCAN_WINDOW
+# Message HTML read after the header, for detecting the date format
+HEADER_SAMPLE_SIZE = 100 * 1024
+
+# Serializes seek and read where os.pread is not available (Windows)
+seek_lock = threading.Lock()
+
+
+def read_at(file: BinaryIO, offset: int, size: int) -> bytes:
+    """
+    Reads up to size bytes at an offset without depending on the file position.
+    
+    Uses os.pread where available, so any number of threads can read from
+    one shared file; elsewhere the file is seeked and read under a lock.
+    
+    Args:
+        file: File opened in binary mode
+        offset: Offset to read from
+        size: Number of bytes to read
+    
+    Returns:
+        The bytes read, fewer than size only at the end of the file
+    """
+    if not hasattr(os, "pread"):
+        with seek_lock:
+            file.seek(offset)
+            return file.read(size)
+    
+    parts = []
+    while size > 0:
+        part = os.pread(file.fileno(), size, offset)
+        if not part:
+            break
+        parts.append(part)
+        offset += len(part)
+        size -= len(part)
+    return b"".join(parts)
+
+
+def find_group_start(file: BinaryIO, offset: int, size: int) -> int:
+    """
+    Finds the first message group marker at or after an offset.
+    
+    Args:
+        file: File opened in binary mode
+        offset: Offset to search from
+        size: Size of the file
+    
+    Returns:
+        Offset of the marker, or size if there is none
+    """
+    position = offset
+    tail = b""
+    while position < size:
+        window = read_at(file, position, SCAN_WINDOW)
+        if not window:
+            break
+        data = tail + window
+        found = data.find(GROUP_MARKER)
+        if found != -1:
+            return position - len(tail) + found
+        tail = data[-(len(GROUP_MARKER) - 1):]
+        position += len(window)
+    return size
+
+
+def read_export_start(file: BinaryIO, sample_size: int = HEADER_SAMPLE_SIZE) -> bytes:
+    """
+    Reads the header of an export and a sample of the messages after it.
+    
+    The file is scanned block by block up to the start of the chatlog,
+    however large the header is, and then sample_size bytes further. An
+    export without a chatlog marker is only read up to its first message
+    group, where the header ends at the latest.
+    
+    Args:
+        file: File opened in binary mode, which may be a decompressing reader
+        sample_size: Bytes to read after the header
+    
+    Returns:
+        The bytes read from the start of the file
+    """
+    buffer = bytearray()
+    header_end = -1
+    while header_end == -1:
+        block = file.read(SCAN_WINDOW)
+        if not block:
+            return bytes(buffer)
+        # Markers may be split between blocks
+        search_from = max(len(buffer) - len(GROUP_MARKER) + 1, 0)
+        buffer += block
+        found = [buffer.find(marker, search_from) for marker in (CHATLOG_MARKER, GROUP_MARKER)]
+        header_end = min((position for position in found if position != -1), default=-1)
+    
+    while len(buffer) < header_end + sample_size:
+        block = file.read(header_end + sample_size - len(buffer))
+        if not block:
+            break
+        buffer += block
+    return bytes(buffer)
+
+
+def split_ranges(start: int, size: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits the bytes from start to size into ranges of chunk_size bytes without reading them.
+    
+    The ranges do not follow message group boundaries; each worker realigns
+    its own range with read_message_range, so splitting costs no I/O.
+    
+    Args:
+        start: Offset of the first range
+        size: Size of the file
+        chunk_size: Size of each range in bytes, at least MIN_RANGE_SIZE
+    
+    Returns:
+        List of (start, end) tuples
+    """
+    chunk_size = max(chunk_size, MIN_RANGE_SIZE)
+    return [(offset, min(offset + chunk_size, size)) for offset in range(start, size, chunk_size)]
+
+
+def read_message_range(file: BinaryIO, start: int, end: int, size: int) -> Tuple[int, int, bytes]:
+    """
+    Reads the message groups whose markers start in the byte range [start, end).
+    
+    Both bounds are moved forward to the next message group marker, so the
+    ranges of split_ranges together cover every message group exactly once
+    and no group is split between two ranges. Realigning costs a read of a
+    few kilobytes at each bound. A range without a marker of its own, inside
+    a group larger than the range, comes back empty.
+    
+    Args:
+        file: File opened in binary mode, which may be shared between threads
+        start: Start of the range
+        end: End of the range
+        size: Size of the file
+    
+    Returns:
+        Tuple (start, end, data) with the realigned bounds and the bytes between them
+    """
+    group_start = find_group_start(file, start, size)
+    group_end = find_group_start(file, end, size) if end < size else size
+    if group_end <= group_start:
+        return group_start, group_start, b""
+    return group_start, group_end, read_at(file, group_start, group_end - group_start)
+
+
+class StreamChunker:
+    """
+    Cuts a stream of byte blocks, fed one at a time, into chunks that each end on a message group boundary.
+    
+    Each chunk starts at a message group marker, for input that cannot be
+    read at random offsets, such as decompressed data or a network stream.
+    The bytes before the first marker are the header of the export, which is
+    kept whole in header when keep_header is set and dropped otherwise.
+    Only the current chunk and one block are held in memory besides it.
+    """
+    
+    def __init__(self, chunk_size: int, keep_header: bool = False):
+        self.chunk_size = max(chunk_size, 1)
+        self.keep_header = keep_header
+        self.header = None
+        self.started = False
+        self.buffer = bytearray()
+        self.offset = 0
+        self.search_from = 0
+    
+    def feed(self, block: bytes) -> List[Tuple[int, bytes]]:
+        """
+        Adds the next block of the stream.
+        
+        Args:
+            block: Bytes following the blocks fed so far
+        
+        Returns:
+            List of the chunks completed by the block, as tuples (offset, chunk)
+            with the offset of the chunk in the stream
+        """
+        self.buffer += block
+        
+        if not self.started:
+            marker = self.buffer.find(GROUP_MARKER, self.search_from)
+            if marker == -1:
+                if not self.keep_header:
+                    # Keep the tail in case a marker is split between blocks
+                    drop = max(len(self.buffer) - len(GROUP_MARKER), 0)
+                    del self.buffer[:drop]
+                    self.offset += drop
+                self.search_from = max(len(self.buffer) - len(GROUP_MARKER) + 1, 0)
+                return []
+            if self.keep_header:
+                self.header = bytes(self.buffer[:marker])
+            del self.buffer[:marker]
+            self.offset += marker
+            self.search_from = 0
+            self.started = True
+        
+        chunks = []
+        while len(self.buffer) > self.chunk_size:
+            cut = self.buffer.find(GROUP_MARKER, max(self.chunk_size, self.search_from))
+            if cut == -1:
+                self.search_from = max(len(self.buffer) - len(GROUP_MARKER), self.chunk_size)
+                break
+            chunks.append((self.offset, bytes(self.buffer[:cut])))
+            del self.buffer[:cut]
+            self.offset += cut
+            self.search_from = 0
+        return chunks
+    
+    def finish(self) -> List[Tuple[int, bytes]]:
+        """
+        Ends the stream.
+        
+        Returns:
+            List with the last chunk, holding the rest of the stream, or an
+            empty list if the stream had no message group
+        """
+        chunks = [(self.offset, bytes(self.buffer))] if self.started and self.buffer else []
+        self.buffer = bytearray()
+        return chunks
+
+
+def iter_stream_chunks(blocks: Iterator[bytes], chunk_size: int) -> Iterator[Tuple[int, bytes]]:
+    """
+    Cuts a stream of byte blocks into chunks, each ending on a message group boundary.
+    
+    See StreamChunker, which does the cutting.
+    
+    Args:
+        blocks: Iterator of byte blocks in input order
+        chunk_size: Minimum chunk size in bytes
+    
+    Yields:
+        Tuple (offset, chunk) with the offset of the chunk in the stream
+    """
+    chunker = StreamChunker(chunk_size)
+    for block in blocks:
+        yield from chunker.feed(block)
+    yield from chunker.finish()
@@ -0,0 +1,52 @@
+"""
+Byte-level scanner for Discord HTML files.
+
+Finds message group boundaries in raw bytes by tracking div nesting depth,
+without building a parse tree.
+"""
+
+import re
+from typing import Iterator, Tuple
+
+
+GROUP_MARKER = b'<div class="chatlog__message-group"'
+CHATLOG_MARKER = b'<div class="chatlog">'
+
+DIV_TAG = re.compile(rb'<div[\s>]|</div\s*>')
+
+
+def iter_group_spans(data: bytes, start: int = 0) -> Iterator[Tuple[int, int]]:
+    """
+    Yields the byte spans of top-level message groups.
+    
+    Args:
+        data: Raw bytes of the HTML content
+        start: Offset to start scanning from
+        
+    Yields:
+        Tuple (start, end) of each complete message group, where end is
+        the offset just after its closing </div>
+        
+    Raises:
+        ValueError: If a message group is not closed before the end of data.
+            The error carries the offset of the unterminated group in args[1].
+    """
+    position = data.find(GROUP_MARKER, start)
+    
+    while position != -1:
+        depth = 0
+        end = -1
+        for tag in DIV_TAG.finditer(data, position):
+            if tag.group().startswith(b'</'):
+                depth -= 1
+                if depth == 0:
+                    end = tag.end()
+                    break
+            else:
+                depth += 1
+        
+        if end == -1:
+            raise ValueError("Unterminated message group", position)
+        
+        yield position, end
+        position = data.find(GROUP_MARKER, end)
@@ -0,0 +1,164 @@
+"""
+Timestamp classifier for Discord message groups.
+
+Exports use one date format throughout, so the classifier detects the
+format once and then tries only that format's precompiled pattern,
+falling back to the other formats when it does not match. Results are
+cached by timestamp string, since all messages sent in the same minute
+share one.
+
+The title attributes of an export hold full dates ("Tuesday, March 12,
+2019"), on which the formats do not overlap, so the detected format and
+the cache only speed classification up and one classifier can be shared
+by runs over different exports. The text shown may be in a locale format
+such as "03/12/2019", which dd/mm/yyyy reads day first, so titles are
+classified first and the text only when a group has no usable title.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dsparser.utils.html_helpers import month_number, expand_short_year
+
+
+# Each format maps a timestamp string to a match with (day, month, year) groups,
+# where month is a name or number and year has two or four digits
+DATE_FORMATS = [
+    ("day-mon-yy", re.compile(r'(\d{1,2})-(\w+)-(\d{4}|\d{2})\b')),
+    ("day mon yyyy", re.compile(r'(\d{1,2})\s+(\w+)\s+(\d{4})')),
+    ("mon day, yyyy", re.compile(r'(?P<month>[A-Za-z]+)\s+(?P<day>\d{1,2}),\s+(?P<year>\d{4})')),
+    ("dd/mm/yyyy", re.compile(r'(\d{1,2})/(\d{2})/(\d{4})')),
+]
+
+# Where the timestamp of a message group is found, in order of preference
+TIMESTAMP_TITLE = re.compile(r'<span class="chatlog__timestamp"[^>]*title="([^"]+)"')
+MESSAGE_SENT_TITLE = re.compile(r'title="Message sent:\s*([^"]+)"')
+MESSAGE_SENT_PREFIX = re.compile(r'^Message sent:\s*')
+TIMESTAMP_TEXT = re.compile(r'<span class="chatlog__timestamp"[^>]*>([^<]+)</span>')
+
+CACHE_SIZE = 65536
+
+DateParts = Tuple[str, Optional[int], int]
+
+
+def match_date_parts(date_match) -> DateParts:
+    """Converts a DATE_FORMATS match to (year, month, day)"""
+    if date_match.re.groupindex:
+        day, month, year = date_match.group("day", "month", "year")
+    else:
+        day, month, year = date_match.groups()
+    if len(year) == 2:
+        year = expand_short_year(year)
+    return year, month_number(month), int(day)
+
+
+def find_timestamps(html: str) -> List[str]:
+    """Returns the timestamp strings found in a piece of export HTML"""
+    return TIMESTAMP_TITLE.findall(html) or MESSAGE_SENT_TITLE.findall(html) or [
+        text.strip() for text in TIMESTAMP_TEXT.findall(html)
+    ]
+
+
+class TimestampClassifier:
+    """
+    Classifies timestamp strings into (year, month, day) with a detected
+    date format and a cache.
+    """
+    
+    def __init__(self, cache_size: int = CACHE_SIZE):
+        self.formats = DATE_FORMATS
+        self.detected = False
+        self.cache: Dict[str, Optional[DateParts]] = {}
+        self.cache_size = cache_size
+    
+    def detect(self, sample_html: str) -> Optional[str]:
+        """
+        Detects the date format from a sample of the export and tries it first from now on.
+        
+        Args:
+            sample_html: Beginning of the export, containing some message groups
+        
+        Returns:
+            Name of the detected format, or None if no timestamp in the sample matched
+        """
+        timestamps = find_timestamps(sample_html)
+        best_count = 0
+        best_index = None
+        for index, (_, pattern) in enumerate(DATE_FORMATS):
+            count = sum(1 for timestamp in timestamps if pattern.search(timestamp))
+            if count > best_count:
+                best_count, best_index = count, index
+        
+        if best_index is None:
+            return None
+        self.prefer(best_index)
+        self.detected = True
+        return DATE_FORMATS[best_index][0]
+    
+    def prefer(self, index: int) -> None:
+        """Moves a format to the front of the formats tried"""
+        if self.formats[0] is not DATE_FORMATS[index]:
+            preferred = DATE_FORMATS[index]
+            self.formats = [preferred] + [date_format for date_format in DATE_FORMATS if date_format is not preferred]
+    
+    def classify(self, timestamp: str) -> Optional[DateParts]:
+        """
+        Classifies a timestamp string.
+        
+        Args:
+            timestamp: Timestamp string as written in the export
+        
+        Returns:
+            Tuple (year, month, day) or None if no format matched. Month is
+            None when the month name is not recognized.
+        """
+        try:
+            return self.cache[timestamp]
+        except KeyError:
+            pass
+        
+        result = None
+        formats = self.formats
+        for position, date_format in enumerate(formats):
+            date_match = date_format[1].search(timestamp)
+            if date_match:
+                result = match_date_parts(date_match)
+                if position and not self.detected:
+                    # No sample was seen in this process, so learn the format from the data once
+                    self.prefer(DATE_FORMATS.index(date_format))
+                    self.detected = True
+                break
+        
+        if len(self.cache) >= self.cache_size:
+            self.cache.clear()
+        self.cache[timestamp] = result
+        return result
+    
+    def classify_first(self, timestamps: Iterable[Optional[str]]) -> Optional[DateParts]:
+        """
+        Classifies the first of several timestamp strings that a format matches.
+        
+        Args:
+            timestamps: Timestamp strings in order of preference, where None is
+                skipped. A generator only computes the strings that are needed
+        
+        Returns:
+            Tuple (year, month, day) or None if no format matched any of them
+        """
+        for timestamp in timestamps:
+            if timestamp:
+                result = self.classify(timestamp.strip())
+                if result is not None:
+                    return result
+        return None
+    
+    def classify_html(self, html: str) -> Optional[DateParts]:
+        """Classifies the first timestamp of a message group from its HTML, trying each place a timestamp can be"""
+        return self.classify_first(
+            match.group(1)
+            for match in (pattern.search(html) for pattern in (TIMESTAMP_TITLE, MESSAGE_SENT_TITLE, TIMESTAMP_TEXT))
+            if match
+        )
+
+
+timestamp_classifier = TimestampClassifier()
@@ -0,0 +1,54 @@
+"""
+Tests of the month and week partitions of message groups whose shown text
+is in a locale format that the date formats of the titles misread.
+"""
+
+import pytest
+
+from dsparser.backends import BACKENDS, available_backends
+from dsparser.partition import parse_message_info, by_month, by_week
+from dsparser.utils.timestamps import timestamp_classifier
+
+
+# Title with the full date and text in the US format, which dd/mm/yyyy reads as 3 December
+US_TEXT_GROUP = (
+    '<div class="chatlog__message-group">'
+    '<span class="chatlog__timestamp" title="Tuesday, March 12, 2019 10:00 AM">03/12/2019 10:00 AM</span>'
+    '</div>'
+)
+
+# No title on the timestamp span, so the "Message sent:" title of the message is used
+MESSAGE_SENT_GROUP = (
+    '<div class="chatlog__message-group">'
+    '<span class="chatlog__timestamp">12/3/2019</span>'
+    '<div class="chatlog__message" title="Message sent: Tuesday, December 3, 2019"></div>'
+    '</div>'
+)
+
+
+@pytest.fixture(autouse=True)
+def detected_format():
+    timestamp_classifier.detect(US_TEXT_GROUP + MESSAGE_SENT_GROUP)
+
+
+@pytest.mark.parametrize("backend", [
+    pytest.param(name, marks=pytest.mark.skipif(name not in available_backends(), reason=f"{name} is not installed"))
+    for name in BACKENDS
+])
+def test_backends_classify_title_before_text(backend):
+    groups = BACKENDS[backend].parse(US_TEXT_GROUP + MESSAGE_SENT_GROUP)
+    infos = [BACKENDS[backend].classify(group) for group in groups]
+    assert [(info.year, info.month, info.day) for info in infos] == [("2019", 3, 12), ("2019", 12, 3)]
+
+
+def test_scan_classifies_title_before_text():
+    info = parse_message_info(US_TEXT_GROUP)
+    assert (info.year, info.month, info.day) == ("2019", 3, 12)
+    info = parse_message_info(MESSAGE_SENT_GROUP)
+    assert (info.year, info.month, info.day) == ("2019", 12, 3)
+
+
+def test_month_and_week_keys_follow_title():
+    info = parse_message_info(US_TEXT_GROUP)
+    assert by_month(info) == "2019-03"
+    assert by_week(info) == "2019-W11"